@@ -96,34 +96,19 @@ def add_drink_back(df_processed: pl.DataFrame, df_drink: pl.DataFrame) -> pl.Dat
 def cap_outliers_iqr(df, column='Views', group_by='Drink', factor=1.5):
     """Cap outliers using IQR method for each drink separately"""
     
-    result = df.clone()
-    
-    for drink in df[group_by].unique():
-        mask = df[group_by] == drink
-        values = df.filter(mask)[column]
-        
-        q1 = values.quantile(0.25)
-        q3 = values.quantile(0.75)
-        iqr = q3 - q1
-        
-        lower_bound = q1 - factor * iqr
-        upper_bound = q3 + factor * iqr
+    q1 = pl.col(column).quantile(0.25).over(group_by)
+    q3 = pl.col(column).quantile(0.75).over(group_by)
+    iqr = q3 - q1
 
-        #rounding it so it is a whole number (as there cannot be half clicks)
-        lower_bound = lower_bound.round(0)
-        upper_bound = upper_bound.round(0)
-        
-        # Cap the values
-        result = result.with_columns(
-            pl.when((pl.col(group_by) == drink) & (pl.col(column) > upper_bound))
-            .then(upper_bound)
-            .when((pl.col(group_by) == drink) & (pl.col(column) < lower_bound))
-            .then(lower_bound)
-            .otherwise(pl.col(column))
-            .alias(column)
-        )
+    #rounding it so it is a whole number (as there cannot be half clicks)
+    lower_bound = (q1 - factor * iqr).round(0)
+    upper_bound = (q3 + factor * iqr).round(0)
     
-    return result
+    # Cap the values of all drinks in one pass
+    return df.with_columns(
+        pl.col(column).cast(pl.Float64).clip(lower_bound, upper_bound).alias(column)
+    )
+
 
 def cap_outliers_percentile(df, column='Views', lower=1, upper=99):
     """Cap outliers using percentile method"""
@@ -186,20 +171,19 @@ def prepare_forecasting_schema(df: pl.DataFrame) -> pl.DataFrame:
     )
 
 
-def create_holiday_features(start_date: str = "2020-07-01", end_date: str = "2026-01-31") -> pl.DataFrame:
+def create_holiday_features(start_date: str = "2020-07-01", end_date: str = "2026-01-31", country: str = "US", subdiv: str = None) -> pl.DataFrame:
     """
-    Create holiday features for the US (adjust country as needed)
+    Create holiday features for a country (US by default)
     
     Args:
         start_date: Start date for holiday range
         end_date: End date for holiday range
+        country: Country code for the holidays package, e.g. "US" or "AT"
+        subdiv: Optional subdivision (state/region) of the country
     
     Returns:
         DataFrame with holiday information
     """
-    # Get US holidays (change to your country if needed)
-    us_holidays = holidays.US(years=range(2020, 2027))
-    
     # Create date range
     date_range = pl.date_range(
         start = pl.Series([start_date]).cast(pl.Date)[0],
@@ -207,39 +191,52 @@ def create_holiday_features(start_date: str = "2020-07-01", end_date: str = "202
         interval="1d",
         eager=True
     )
+
+    # Get the holidays incl. one year before and after so the distances at the edges are right
+    country_holidays = holidays.country_holidays(
+        country, subdiv=subdiv, years=range(date_range[0].year - 1, date_range[-1].year + 2)
+    )
+    holiday_table = pl.DataFrame(
+        {"holiday": list(country_holidays.keys()), "holiday_name": list(country_holidays.values())},
+        schema={"holiday": pl.Date, "holiday_name": pl.String},
+    ).sort("holiday")
+    holiday_dates = holiday_table.select("holiday")
     
     # Create holiday dataframe
     holiday_df = pl.DataFrame({
         "ds": date_range
     })
     
-    # Add holiday indicators
-    holiday_df = holiday_df.with_columns([
-        # Is it a holiday?
-        pl.col("ds").map_elements(lambda x: x in us_holidays, return_dtype=pl.Boolean).alias("is_holiday"),
-        
-        # Holiday name (empty string if not a holiday)
-        pl.col("ds").map_elements(lambda x: us_holidays.get(x, ""), return_dtype=pl.String).alias("holiday_name"),
-        
-        # Days until next holiday
-        pl.col("ds").map_elements(
-            lambda x: min([abs((h - x).days) for h in us_holidays.keys() if (h - x).days > 0] + [365]),
-            return_dtype=pl.Int64
-        ).alias("days_to_holiday"),
-        
-        # Days since last holiday
-        pl.col("ds").map_elements(
-            lambda x: min([abs((x - h).days) for h in us_holidays.keys() if (x - h).days > 0] + [365]),
-            return_dtype=pl.Int64
-        ).alias("days_since_holiday"),
-    ])
+    # Add holiday indicators, next/last holiday via sorted as-of joins instead of a per day scan
+    holiday_df = (
+        holiday_df
+        .join_asof(holiday_dates.rename({"holiday": "next"}), left_on="ds", right_on="next",
+                   strategy="forward", allow_exact_matches=False)
+        .join_asof(holiday_dates.rename({"holiday": "last"}), left_on="ds", right_on="last",
+                   strategy="backward", allow_exact_matches=False)
+        .join(holiday_table, left_on="ds", right_on="holiday", how="left", maintain_order="left")
+        .with_columns([
+            # Is it a holiday?
+            pl.col("holiday_name").is_not_null().alias("is_holiday"),
+            
+            # Holiday name (empty string if not a holiday)
+            pl.col("holiday_name").fill_null(""),
+            
+            # Days until next holiday
+            (pl.col("next") - pl.col("ds")).dt.total_days().fill_null(365).alias("days_to_holiday"),
+            
+            # Days since last holiday
+            (pl.col("ds") - pl.col("last")).dt.total_days().fill_null(365).alias("days_since_holiday"),
+        ])
+        .drop("next", "last")
+    )
     
     # Count number of holidays in a rolling window (e.g., next 7 days)
     holiday_df = holiday_df.with_columns([
         pl.col("is_holiday").cast(pl.Int64).alias("num_holidays")
     ])
     
-    return holiday_df
+    return holiday_df.select("ds", "is_holiday", "holiday_name", "days_to_holiday", "days_since_holiday", "num_holidays")
 
 def split_train_test(df: pl.DataFrame, val_start: str = "2024-01-01", val_end: str = "2025-01-01") -> Dict[str, pl.DataFrame]:
     """
@@ -263,13 +260,137 @@ def split_train_test(df: pl.DataFrame, val_start: str = "2024-01-01", val_end: s
     }
 
 
-def make_feature_dicts(
+HOLIDAY_COLUMNS = ["is_holiday", "holiday_name", "days_to_holiday", "days_since_holiday", "num_holidays"]
+FEATURE_SETS = ["none", "holidays", "fourier", "trend", "fourier+trend+holidays"]
+
+
+def feature_columns(feature_type: str, columns: list[str]) -> list[str]:
+    """
+    Columns of a feature set in the feature matrix
+    
+    Args:
+        feature_type: One of FEATURE_SETS
+        columns: All columns of the feature matrix
+        
+    Returns:
+        The feature columns (without unique_id, ds, y)
+    """
+    fourier_columns = [c for c in columns if c.startswith(("sin", "cos"))]
+    return {
+        "none": [],
+        "holidays": HOLIDAY_COLUMNS,
+        "fourier": fourier_columns,
+        "trend": ["trend"],
+        "fourier+trend+holidays": HOLIDAY_COLUMNS + fourier_columns + ["trend"],
+    }[feature_type]
+
+
+def build_feature_matrix(
     dfs: Dict[str, pl.DataFrame], 
     DATA_SPLITS: list[str] = ["train", "val", "test"],
     holiday_df: pl.DataFrame = None,
     h: int = H,
     freq: str = FREQ,
     season_length: int = SEASON_LENGTH
+) -> pl.DataFrame:
+    """
+    Compute all features once over the full date range plus the horizon
+    
+    Args:
+        dfs: Dictionary with train/val/test splits
+        DATA_SPLITS: List of split names, in time order
+        holiday_df: Holiday feature dataframe
+        h: Forecast horizon (days)
+        freq: Frequency string
+        season_length: Length of seasonal period (7 for weekly)
+        
+    Returns:
+        One wide DataFrame with unique_id, ds, y, split and all feature columns,
+        the h days after the data have split "future" and no y
+    """
+    if holiday_df is None:
+        holiday_df = create_holiday_features()
+
+    df_full = pl.concat([dfs[split].with_columns(pl.lit(split).alias("split")) for split in DATA_SPLITS])
+    
+    # Fourier features (captures seasonality)
+    df_fourier, future_fourier = fourier(
+        df=df_full.drop("split"), 
+        freq=freq, 
+        season_length=season_length,  # Weekly seasonality
+        k=3,  # Number of Fourier terms (adjust as needed)
+        h=h
+    )
+    
+    # Trend features
+    df_trend, future_trend = trend(
+        df=df_full.drop("split"), 
+        freq=freq, 
+        h=h
+    )
+
+    history = (
+        df_full
+        .join(df_fourier.drop("y"), ["unique_id", "ds"])
+        .join(df_trend.drop("y"), ["unique_id", "ds"])
+    )
+    future = (
+        future_fourier
+        .join(future_trend, ["unique_id", "ds"])
+        .with_columns(pl.lit("future").alias("split"))
+    )
+    
+    # Holiday features, joined once for all splits
+    return (
+        pl.concat([history, future], how="diagonal_relaxed")
+        .join(holiday_df, "ds", "left")
+        .with_columns(pl.col("split").cast(pl.Enum([*DATA_SPLITS, "future"])))
+        .sort(["unique_id", "ds"])
+    )
+
+
+def feature_slice(
+    matrix: pl.LazyFrame,
+    feature_type: str,
+    split: str,
+    future: bool = False,
+    h: int = H
+) -> pl.LazyFrame:
+    """
+    Lazy slice of one feature set and split of the feature matrix, only the needed columns are read
+    
+    Args:
+        matrix: The feature matrix, e.g. pl.scan_parquet of the saved one
+        feature_type: One of FEATURE_SETS
+        split: Split name
+        future: If True the future features of the h days after the split (no y)
+        h: Forecast horizon (days)
+        
+    Returns:
+        LazyFrame in utilsforecast format
+    """
+    columns = feature_columns(feature_type, matrix.collect_schema().names())
+    if not future:
+        return matrix.filter(pl.col("split") == split).select(["unique_id", "ds", "y", *columns])
+
+    split_end = matrix.filter(pl.col("split") == split).select(pl.col("ds").max())
+    return (
+        matrix
+        .join(split_end.rename({"ds": "split_end"}), how="cross")
+        .filter((pl.col("ds") > pl.col("split_end")) & (pl.col("ds") <= pl.col("split_end") + pl.duration(days=h)))
+        .select(["unique_id", "ds", *columns])
+    )
+
+
+def make_feature_dicts(
+    dfs: Dict[str, pl.DataFrame], 
+    DATA_SPLITS: list[str] = ["train", "val", "test"],
+    holiday_df: pl.DataFrame = None,
+    h: int = H,
+    freq: str = FREQ,
+    season_length: int = SEASON_LENGTH,
+    matrix: pl.DataFrame = None,
+    lazy: bool = False
 ) -> Tuple[Dict[str, Dict[str, pl.DataFrame]], Dict[str, Dict[str, pl.DataFrame|None]]]:
     """
     Create feature engineering pipeline for cafe drinks prediction
@@ -281,6 +402,9 @@ def make_feature_dicts(
     - trend: linear trend
     - fourier+trend+holidays: all features combined
     
+    All features are computed once (see build_feature_matrix), every feature set and
+    split is a slice of that matrix.
+    
     Args:
         dfs: Dictionary with train/val splits
         DATA_SPLITS: List of split names
@@ -288,97 +412,72 @@ def make_feature_dicts(
         h: Forecast horizon (days)
         freq: Frequency string
         season_length: Length of seasonal period (7 for weekly)
+        matrix: Already computed feature matrix, computed from dfs if None
+        lazy: Return LazyFrames instead of DataFrames
         
     Returns:
         Tuple of (features_dict, future_features_dict)
     """
-    if holiday_df is None:
-        holiday_df = create_holiday_features()
-    
-    df: Dict[str, Dict[str, pl.DataFrame]] = {
-        "none": {},
-        "holidays": {}, 
-        "fourier": {}, 
-        "trend": {}, 
-        "fourier+trend+holidays": {}
-    }
-    
-    df_future: Dict[str, Dict[str, pl.DataFrame|None]] = {
-        "none": {},
-        "holidays": {}, 
-        "fourier": {}, 
-        "trend": {}, 
-        "fourier+trend+holidays": {}
-    }
-    
-    for split in DATA_SPLITS:
-        print(f"Processing {split} split...")
-        
-        # Baseline (no features)
-        df["none"][split] = dfs[split]
-        df_future["none"][split] = None
-        
-        # Fourier features (captures seasonality)
-        df["fourier"][split], df_future["fourier"][split] = fourier(
-            df=df["none"][split], 
-            freq=freq, 
-            season_length=season_length,  # Weekly seasonality
-            k=3,  # Number of Fourier terms (adjust as needed)
-            h=h
-        )
-        
-        # Trend features
-        df["trend"][split], df_future["trend"][split] = trend(
-            df=df["none"][split], 
-            freq=freq, 
-            h=h
-        )
-        
-        # Holiday features
-        df["holidays"][split] = dfs[split].join(holiday_df, "ds", "left")
-        df_future["holidays"][split] = df_future["trend"][split].drop("trend").join(
-            holiday_df, "ds", "left"
-        )
-        
-        # Combined features
-        df["fourier+trend+holidays"][split] = (
-            df["holidays"][split]
-            .join(df["fourier"][split].drop("y"), ["unique_id", "ds"])
-            .join(df["trend"][split].drop("y"), ["unique_id", "ds"])
-        )
-        
-        df_future["fourier+trend+holidays"][split] = (
-            df_future["holidays"][split]
-            .join(df_future["fourier"][split], ["unique_id", "ds"])
-            .join(df_future["trend"][split], ["unique_id", "ds"])
-        )
+    if matrix is None:
+        matrix = build_feature_matrix(dfs, DATA_SPLITS, holiday_df, h, freq, season_length)
+    matrix_lazy = matrix.lazy()
+    
+    df: Dict[str, Dict[str, pl.DataFrame]] = {feature_type: {} for feature_type in FEATURE_SETS}
+    df_future: Dict[str, Dict[str, pl.DataFrame|None]] = {feature_type: {} for feature_type in FEATURE_SETS}
+    
+    for feature_type in FEATURE_SETS:
+        for split in DATA_SPLITS:
+            df[feature_type][split] = feature_slice(matrix_lazy, feature_type, split, h=h)
+            # Baseline (no features) has no future features
+            df_future[feature_type][split] = None if feature_type == "none" else feature_slice(
+                matrix_lazy, feature_type, split, future=True, h=h
+            )
+    
+    if not lazy:
+        for feature_type in FEATURE_SETS:
+            for split in DATA_SPLITS:
+                df[feature_type][split] = df[feature_type][split].collect()
+                if df_future[feature_type][split] is not None:
+                    df_future[feature_type][split] = df_future[feature_type][split].collect()
     
     return (df, df_future)
 
 def save_features(
-    df: Dict[str, Dict[str, pl.DataFrame]], 
-    df_future: Dict[str, Dict[str, pl.DataFrame|None]]
+    matrix: pl.DataFrame,
+    filepath: str = "../data/processed_data/features.parquet"
 ) -> None:
     """
-    Save all feature variants to disk
+    Save the feature matrix to disk, one file for all feature sets and splits
     
     Args:
-        df: Features dictionary
-        df_future: Future features dictionary
+        matrix: Feature matrix from build_feature_matrix
+        filepath: Where to write the parquet
+    """
+    matrix.write_parquet(filepath)
+    print(f"Saved {filepath}")
+
+
+def load_feature_set(
+    feature_type: str,
+    split: str,
+    future: bool = False,
+    h: int = H,
+    filepath: str = "../data/processed_data/features.parquet"
+) -> pl.LazyFrame:
     """
+    Lazily load one feature set and split from the saved feature matrix
     
-    for feature_type in df.keys():
-        for split in df[feature_type].keys():
-            # Save current features
-            filepath = f"../data/processed_data/{feature_type}_{split}.parquet"
-            df[feature_type][split].write_parquet(filepath)
-            print(f"Saved {filepath}")
-            
-            # Save future features (if they exist)
-            if df_future[feature_type][split] is not None:
-                future_filepath = f"../data/processed_data//{feature_type}_{split}_future.parquet"
-                df_future[feature_type][split].write_parquet(future_filepath)
-                print(f"Saved {future_filepath}")
+    Args:
+        feature_type: One of FEATURE_SETS
+        split: Split name
+        future: If True the future features of the h days after the split
+        h: Forecast horizon (days)
+        filepath: The saved feature matrix
+        
+    Returns:
+        LazyFrame, only its columns and dates are read when collected
+    """
+    return feature_slice(pl.scan_parquet(filepath), feature_type, split, future, h)
 
 
 def run_feature_engineering_pipeline(
@@ -419,16 +518,17 @@ def run_feature_engineering_pipeline(
     
     # Step 3: Engineer features
     print("\n4. Engineering features")
-    df_features, df_future = make_feature_dicts(
+    matrix = build_feature_matrix(
         dfs=dfs,
         holiday_df=None,
         h=H
     )
+    df_features, df_future = make_feature_dicts(dfs=dfs, h=H, matrix=matrix)
     
     # Step 4: Save features
     if save_output:
         print("\n5. Saving features")
-        save_features(df_features, df_future)
+        save_features(matrix)
     
     
     return df_features, df_future
\ No newline at end of file
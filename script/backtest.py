@@ -0,0 +1,56 @@
+"""Rolling-origin backtest of the final and the baseline model
+
+Usage (from any directory): python backtest.py
+Writes one parquet with a row per window, model, series and day, see [backtest] in config.toml
+"""
+import tomllib
+import sys
+import os
+from datetime import date
+from modules import dataprocessing as data
+from modules import store
+from modules.backtest import run_backtest
+from make_prediction import model_params
+scripts_dir_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, scripts_dir_path)
+base_dir = scripts_dir_path + "/../"
+
+
+def main() -> None:
+    """runs the backtest configured in config.toml"""
+    with open(os.path.join(scripts_dir_path, "config.toml"), "rb") as f:
+        config = tomllib.load(f)
+
+    delta = date.fromisoformat(config["predictions"]["predict_until"]
+                               ) - date.fromisoformat(config["predictions"]["predict_from"])
+    horizon = int(delta.days)
+
+    if config["store"]["use"]:
+        df = store.load(base_dir+config["store"]["path"],
+                        end_date=config["predictions"]["predict_from"],
+                        compact_dtypes=config["data"]["compact"])
+    else:
+        df = data.ingest(base_dir+config["data"]["path"], compact_dtypes=config["data"]["compact"])
+        df = data.preprocess(df, end_date=config["predictions"]["predict_from"],
+                             outlier_method=config["preprocessing"]["outlier_method"],
+                             exclude=config["preprocessing"]["outlier_exclude"],
+                             fill=config["preprocessing"]["fill"] or None,
+                             **config["preprocessing"]["outlier_params"])
+
+    settings = config["backtest"]
+    results = run_backtest(
+        df, horizon, settings["n_windows"], step=settings["step"] or None,
+        train_length=settings["train_length"] or None, refit_every=settings["refit_every"],
+        models=tuple(settings["models"]),
+        # the final model of make_prediction: tuned params and the configured features
+        model_kwargs={"final": {**config["model"], "params": model_params(config)},
+                      "baseline": config["baseline"]},
+        processes=settings["processes"], feature_names=tuple(config["features"]["use"]),
+        feature_params=config["features"]["params"],
+    )
+    results.write_parquet(base_dir+config["predictions"]["path"]+"script_backtest.parquet")
+    print(f"Backtested {results['window'].n_unique()} windows, {results.height} rows")
+
+
+if __name__ == "__main__": # the worker processes import this file again
+    main()
@@ -0,0 +1,55 @@
+"""Benchmark of the outlier engine, shows that the runtime scales linearly with the rows
+
+Run from the script directory: python -m benchmarks.bench_outliers
+"""
+import time
+import polars as pl
+
+from modules import outliers
+from benchmarks.synthetic import long_panel
+
+SIZES = [10, 100, 1_000, 10_000]
+
+
+def _loop_iqr(df: pl.DataFrame, factor: float = 1.5) -> pl.DataFrame:
+    """the former per series implementation, for comparison"""
+    result = df.clone()
+    for drink in df["unique_id"].unique():
+        values = df.filter(df["unique_id"] == drink)["y"]
+        q1, q3 = values.quantile(0.25), values.quantile(0.75)
+        low, high = q1 - factor * (q3 - q1), q3 + factor * (q3 - q1)
+        result = result.with_columns(
+            pl.when((pl.col("unique_id") == drink) & (pl.col("y") > high)).then(high)
+            .when((pl.col("unique_id") == drink) & (pl.col("y") < low)).then(low)
+            .otherwise(pl.col("y")).alias("y")
+        )
+    return result
+
+
+def _time(func, *args, repeat: int = 3, **kwargs) -> float:
+    """best wall time out of repeat runs in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    """prints the time per row of every method for growing panels"""
+    print(f"{'series':>8} {'rows':>10} {'method':>10} {'seconds':>9} {'ns/row':>8}")
+    for n_series in SIZES:
+        df = long_panel(n_series)
+        for method in outliers.METHODS:
+            seconds = _time(outliers.cap_outliers, df, method)
+            print(f"{n_series:>8} {df.height:>10} {method:>10} {seconds:>9.4f} "
+                  f"{seconds / df.height * 1e9:>8.1f}")
+        if n_series <= 100: # quadratic, only feasible for small panels
+            seconds = _time(_loop_iqr, df, repeat=1)
+            print(f"{n_series:>8} {df.height:>10} {'loop iqr':>10} {seconds:>9.4f} "
+                  f"{seconds / df.height * 1e9:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Scaling benchmark of the script/modules pipeline on synthetic pageview panels
+
+Times and peak memory of every stage are appended to a json history, so scaling
+curves and regressions are visible from run to run.
+
+Run from the script directory:
+    python -m benchmarks.bench_pipeline --series 10 1000 100000 --years 1 5 20
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable
+import polars as pl
+
+from modules import dataprocessing as data
+from modules.instrumentation import PeakRSS
+from modules.modelling import BaseLineModel, FinalModel
+from benchmarks.synthetic import write_wide_csv
+
+HISTORY = os.path.join(os.path.dirname(__file__), "history.json")
+H = 31
+
+
+def measure(func: Callable, *args, **kwargs) -> tuple[object, float, int]:
+    """runs func once, returns its result, the wall time and the peak memory above the start"""
+    with PeakRSS() as memory:
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+    return result, seconds, memory.above_start
+
+
+def bench_size(n_series: int, years: float, final_max_series: int, final_steps: int
+               ) -> list[dict]:
+    """times every stage on one panel size"""
+    results = []
+
+    def stage(name: str, func: Callable, *args, **kwargs):
+        result, seconds, memory = measure(func, *args, **kwargs)
+        results.append({"stage": name, "series": n_series, "years": years,
+                        "seconds": seconds, "peak_mb": memory / 2**20})
+        print(f"{n_series:>8} {years:>5} {name:>18} {seconds:>9.3f}s {memory / 2**20:>9.1f}MB")
+        return result
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "raw.csv")
+        write_wide_csv(path, n_series, years)
+        df = stage("ingest", data.ingest, path)
+
+    stage("cap_outliers_iqr", data._cap_outliers_iqr, df) # pylint: disable=protected-access
+    df = stage("preprocess", data.preprocess, df)
+    end = str(df["ds"].max())
+    train, _ = stage("train_test_split", data.train_test_split, df, end, H)
+    train, future = stage("add_features", data.add_features, train, H)
+
+    baseline = BaseLineModel()
+    stage("baseline_fit", baseline.fit, train)
+    stage("baseline_predict", baseline.predict, H, future)
+
+    if n_series <= final_max_series:
+        model = FinalModel(H, device="cpu", params={"max_steps": final_steps, "input_size": 4*H})
+        stage("final_fit", model.fit, train)
+    return results
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main() -> None:
+    """runs all requested sizes and appends them to the history"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--series", type=int, nargs="+", default=[10, 100, 1_000, 10_000])
+    parser.add_argument("--years", type=float, nargs="+", default=[1, 5])
+    parser.add_argument("--final-max-series", type=int, default=1_000,
+                        help="largest panel the FinalModel is fitted on")
+    parser.add_argument("--final-steps", type=int, default=20,
+                        help="training steps of the short FinalModel fit")
+    parser.add_argument("--history", default=HISTORY)
+    args = parser.parse_args()
+
+    print(f"{'series':>8} {'years':>5} {'stage':>18} {'time':>10} {'peak mem':>11}")
+    results = []
+    for years in args.years:
+        for n_series in args.series:
+            results += bench_size(n_series, years, args.final_max_series, args.final_steps)
+
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history, encoding="utf-8") as f:
+            history = json.load(f)
+    history.append({
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "polars": pl.__version__,
+        "cpus": os.cpu_count(),
+        "results": results,
+    })
+    with open(args.history, "w", encoding="utf-8") as f:
+        json.dump(history, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Synthetic pageview panels that look like the wikipedia export
+
+Every series has its own level, a slow trend, weekly and yearly seasonality, poisson
+noise and a few spikes, so outlier capping and the models get realistic work.
+"""
+from datetime import date
+import numpy as np
+import polars as pl
+
+
+def pageviews(n_series: int, years: float = 5, seed: int = 0, start: str = "2020-07-01"
+              ) -> tuple[list[str], np.ndarray, np.ndarray]:
+    """ids, dates and a (series, days) matrix of daily views"""
+    rng = np.random.default_rng(seed)
+    days = int(365 * years)
+    t = np.arange(days)
+    level = rng.lognormal(6, 1.2, (n_series, 1))
+    trend = 1 + rng.normal(0, 0.3, (n_series, 1)) * t / 365 / max(years, 1)
+    phase = rng.uniform(0, 2*np.pi, (n_series, 2))
+    weekly = 1 + rng.uniform(0, 0.2, (n_series, 1)) * np.sin(2*np.pi*t/7 + phase[:, :1])
+    yearly = 1 + rng.uniform(0, 0.5, (n_series, 1)) * np.sin(2*np.pi*t/365.25 + phase[:, 1:])
+    views = rng.poisson(np.clip(level * trend * weekly * yearly, 1, None)).astype(np.float64)
+    spikes = rng.random((n_series, days)) < 0.002
+    views[spikes] *= rng.uniform(5, 30, spikes.sum())
+
+    ids = [f"page_{i}" for i in range(n_series)]
+    dates = np.datetime64(date.fromisoformat(start)) + t.astype("timedelta64[D]")
+    return ids, dates, views.round()
+
+
+def long_panel(n_series: int, years: float = 5, seed: int = 0) -> pl.DataFrame:
+    """panel in nixtla long format: ds, unique_id, y"""
+    ids, dates, views = pageviews(n_series, years, seed)
+    return pl.DataFrame({
+        "ds": np.tile(dates, n_series),
+        "unique_id": np.repeat(ids, len(dates)),
+        "y": views.ravel(),
+    }).with_columns(pl.col("ds").cast(pl.Date))
+
+
+def write_wide_csv(path: str, n_series: int, years: float = 5, seed: int = 0) -> None:
+    """writes a panel in the format of data/raw_data/raw.csv (Date + one column per page)"""
+    ids, dates, views = pageviews(n_series, years, seed)
+    df = pl.DataFrame(views.T.astype(np.int64), schema=ids)
+    df.insert_column(0, pl.Series("Date", dates).cast(pl.Date))
+    df.write_csv(path)
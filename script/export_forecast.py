@@ -0,0 +1,23 @@
+"""Exports one run of the forecast store as csv
+
+Usage (from any directory): python export_forecast.py [run id] [kind]
+Without a run id the newest run is exported, the kind defaults to forecast (or test).
+The csv has a row per series and day and a column per model.
+"""
+import tomllib
+import sys
+import os
+from modules import forecasts
+scripts_dir_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, scripts_dir_path)
+base_dir = scripts_dir_path + "/../"
+
+with open(os.path.join(scripts_dir_path, "config.toml"), "rb") as f:
+    config = tomllib.load(f)
+
+run = sys.argv[1] if len(sys.argv) > 1 else None
+kind = sys.argv[2] if len(sys.argv) > 2 else "forecast"
+path = base_dir+config["predictions"]["path"]+f"script_{run or 'latest'}_{kind}.csv"
+
+forecasts.export_csv(base_dir+config["forecasts"]["path"], path, run=run, kind=kind)
+print(f"Exported {kind} forecasts to {path}")
@@ -0,0 +1,46 @@
+"""Exports the newest stored final model for lightweight cpu inference
+
+Usage (from any directory): python export_model.py [torchscript|onnx]
+The compiled model is written to [serving] compiled (serve.py uses it from there) and
+checked against NeuralForecast's own predict on a sample of the series.
+"""
+import tomllib
+import sys
+import os
+import polars as pl
+from modules import dataprocessing as data
+from modules import store, artifacts, inference
+scripts_dir_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, scripts_dir_path)
+base_dir = scripts_dir_path + "/../"
+
+TOLERANCE = 1e-3 # largest deviation, relative to the mean absolute value of a series
+CHECK_SERIES = 200
+
+with open(os.path.join(scripts_dir_path, "config.toml"), "rb") as f:
+    config = tomllib.load(f)
+
+fmt = sys.argv[1] if len(sys.argv) > 1 else "torchscript"
+out_dir = base_dir+(config["serving"]["compiled"] or "data/models/compiled/")
+key = artifacts.latest(base_dir+config["artifacts"]["path"])
+if key is None:
+    sys.exit("No stored final model, run make_prediction.py first")
+nf = artifacts.load(base_dir+config["artifacts"]["path"], key)
+path = inference.export(nf, out_dir, fmt, artifact=key)
+print(f"Exported model {key} to {path}")
+
+if config["store"]["use"]:
+    history = store.load(base_dir+config["store"]["path"])
+else:
+    history = data.preprocess(data.ingest(base_dir+config["data"]["path"]),
+                              outlier_method=config["preprocessing"]["outlier_method"],
+                              exclude=config["preprocessing"]["outlier_exclude"],
+                              fill=config["preprocessing"]["fill"] or None,
+                              **config["preprocessing"]["outlier_params"])
+sample = history["unique_id"].unique().sample(min(CHECK_SERIES, history["unique_id"].n_unique()),
+                                              seed=0)
+deviation = inference.max_deviation(nf, inference.CompiledPredictor(out_dir),
+                                    history.filter(pl.col("unique_id").is_in(sample)))
+print(f"Largest relative deviation from NeuralForecast.predict: {deviation:.2e}")
+if deviation > TOLERANCE:
+    sys.exit(f"The compiled model deviates by more than {TOLERANCE}, do not serve it")
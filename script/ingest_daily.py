@@ -0,0 +1,30 @@
+"""Appends new days of pageviews to the processed store
+
+Usage (from any directory): python ingest_daily.py [path to new export]
+The export has the same format as the raw data and may overlap with the store,
+without a path the raw data path from the config is used (e.g. for the first build).
+"""
+import tomllib
+import sys
+import os
+from modules import dataprocessing as data
+from modules import store
+scripts_dir_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, scripts_dir_path)
+base_dir = scripts_dir_path + "/../"
+
+with open(os.path.join(scripts_dir_path, "config.toml"), "rb") as f:
+    config = tomllib.load(f)
+
+path = sys.argv[1] if len(sys.argv) > 1 else base_dir+config["data"]["path"]
+
+delta = data.ingest(path)
+if config["preprocessing"]["fill"]: # gaps within the export, the store is appended per day
+    delta = data.fill_gaps(delta, config["preprocessing"]["fill"])
+rebuilt = store.append(base_dir+config["store"]["path"], delta,
+                       method=config["preprocessing"]["outlier_method"],
+                       exclude=config["preprocessing"]["outlier_exclude"],
+                       max_age=config["store"]["max_age"],
+                       **config["preprocessing"]["outlier_params"])
+
+print("Store fully recomputed" if rebuilt else "Appended new days to the store")
@@ -1,56 +1,265 @@
-"""The script for processing raw data into a prediction"""
+"""The script for processing raw data into a prediction
+
+Usage (from any directory):
+    python make_prediction.py [command] [--config path] [--deadline time]
+
+    all       evaluate, then refit on all data and forecast (the default)
+    ingest    only load and preprocess the data and print a summary
+    evaluate  fit the final and the baseline model on train, score them on test
+    forecast  fit the final model on all data and write the forecast
+    baseline  fit the baseline on all data and write its forecast, no torch needed
+
+Only the libraries a command needs are imported, so ingest and baseline start fast.
+With --deadline the forecast falls back to the statistical tier if NHITS is late.
+"""
+import argparse
+import functools
+import json
 import tomllib
 import sys
 import os
 from datetime import date
+import polars as pl
 from modules import dataprocessing as data
-from modules.modelling import FinalModel, BaseLineModel
-# from modules import visialising as vis
+from modules import store, instrumentation, features, forecasts
 scripts_dir_path = os.path.abspath(os.path.dirname(__file__))
 sys.path.insert(0, scripts_dir_path)
 base_dir = scripts_dir_path + "/../"
 
-# Data ingestion
-with open("config.toml", "rb") as f:
-    config = tomllib.load(f)
+COMMANDS = ("all", "ingest", "evaluate", "forecast", "baseline")
+
+
+def load_config(path: str) -> dict:
+    """the config, its paths are relative to the repository root"""
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+def horizon(config: dict) -> int:
+    """calculate the correct horizon, needed for us if we have data before the 31st"""
+    delta = date.fromisoformat(config["predictions"]["predict_until"]
+                               ) - date.fromisoformat(config["predictions"]["predict_from"])
+    return int(delta.days)
+
+
+def load_data(config: dict):
+    """processed data up to predict_from, from the store or the raw data"""
+    if config["store"]["use"]: # already capped by ingest_daily.py
+        return store.load(base_dir+config["store"]["path"],
+                          end_date=config["predictions"]["predict_from"],
+                          lazy=config["data"]["lazy"], compact_dtypes=config["data"]["compact"])
+    df = data.ingest( base_dir+config["data"]["path"], lazy=config["data"]["lazy"],
+                     compact_dtypes=config["data"]["compact"])
+    return data.preprocess(df, end_date=config["predictions"]["predict_from"],
+                           outlier_method=config["preprocessing"]["outlier_method"],
+                           exclude=config["preprocessing"]["outlier_exclude"],
+                           fill=config["preprocessing"]["fill"] or None,
+                           **config["preprocessing"]["outlier_params"])
+
+
+def model_params(config: dict) -> dict:
+    """the tuned params of the final model and its configured features"""
+    params = {}
+    if os.path.exists(base_dir+config["tuning"]["best_params"]): # written by tune.py
+        with open(base_dir+config["tuning"]["best_params"], encoding="utf-8") as f:
+            params = json.load(f)
+    names, feature_params = config["features"]["use"], config["features"]["params"]
+    if names: # the model consumes exactly the configured features
+        params["futr_exog_list"] = features.columns(names, feature_params, future_only=True)
+        params["hist_exog_list"] = [c for c in features.columns(names, feature_params)
+                                    if c not in params["futr_exog_list"]]
+    return params
+
+
+def min_length(config: dict) -> int:
+    """days a series needs for one training window of the final model"""
+    h = horizon(config)
+    input_size = model_params(config).get("input_size", 18*h) # the default of FinalModel
+    return config["preprocessing"]["min_length"] or input_size + h
+
+
+def route_short(prediction: pl.DataFrame, base_pred: pl.DataFrame, short: pl.DataFrame
+                ) -> pl.DataFrame:
+    """the baseline forecast stands in for the series too short for the final model"""
+    if short.is_empty():
+        return prediction
+    ids = short.select(pl.col("unique_id").unique())
+    print(f"{ids.height} series too short for the final model, using the baseline for them")
+    value_col = next(c for c in prediction.columns if c not in ("unique_id", "ds"))
+    stand_in = base_pred.join(ids, on="unique_id", how="semi").select(
+        "unique_id", "ds", pl.col("SeasonalNaive").alias(value_col)).cast(prediction.schema)
+    return pl.concat([prediction, stand_in]).sort("unique_id", "ds")
+
+
+def only(df: pl.DataFrame | None, series: pl.DataFrame) -> pl.DataFrame | None:
+    """the rows of df (e.g. the future features) of the series in series"""
+    if df is None:
+        return None
+    return df.join(series.select(pl.col("unique_id").unique()), on="unique_id", how="semi")
+
+
+def final_model(config: dict):
+    """the configured final model with the tuned params and the configured features"""
+    from modules.modelling import FinalModel # pylint: disable=import-outside-toplevel
+
+    kwargs = {"artifact_dir": base_dir+config["artifacts"]["path"],
+              "fine_tune_steps": config["artifacts"]["fine_tune_steps"],
+              "params": model_params(config),
+              **config["model"]}
+    sharding = config["sharding"]
+    if sharding["use"]: # one model per shard of series, see modules/sharding.py
+        from modules.sharding import ShardedModel # pylint: disable=import-outside-toplevel
+        return ShardedModel(horizon(config), n_shards=sharding["n_shards"],
+                            strategy=sharding["strategy"], processes=sharding["processes"],
+                            shard_dir=base_dir+sharding["path"], **kwargs)
+    return FinalModel(horizon(config), **kwargs)
+
+
+def ingest(config: dict) -> None:
+    """loads and preprocesses the data, e.g. as a quick check of a new export"""
+    df = data.collect(load_data(config))
+    print(f"{df.height} rows, {df['unique_id'].n_unique()} series, "
+          f"{df['ds'].min()} to {df['ds'].max()}")
+    report = data.coverage(df)
+    gaps = report.filter(pl.col("missing") > 0) # type: ignore
+    if not gaps.is_empty():
+        print(f"{gaps.height} series with missing days (set [preprocessing] fill):\n", gaps)
+    short = report.filter(pl.col("observed") < min_length(config)) # type: ignore
+    if not short.is_empty():
+        print(f"{short.height} series too short for the final model:\n", short)
+
+
+def evaluate(config: dict) -> tuple[str, object, pl.DataFrame]:
+    """fits final and baseline model on train and scores them on the test days
+
+    Returns:
+        tuple[str, object, pl.DataFrame]: the run id of the test forecasts, the fitted
+        final model and all data (for the refit)
+    """
+    from modules.baseline import BaseLineModel # pylint: disable=import-outside-toplevel
+    h = horizon(config)
+    df = load_data(config)
+    train, test = data.train_test_split(df, config["predictions"]["predict_from"], h)
+    train, future_features = data.add_features(train, h, config["features"]["use"],
+                                               config["features"]["params"])
+    # model boundary, everything up to here is only a query plan if lazy
+    df, train, test, future_features = data.collect_all([df, train, test, future_features])
+
+    model = final_model(config)
+    base_model = BaseLineModel(**config["baseline"])
+
+    long_train, short_train = data.split_short(train, min_length(config))
+    model.fit(long_train)
+    base_model.fit(train)
+
+    prediction = model.predict(only(future_features, long_train))
+    base_pred = base_model.predict(h, future_features)
+    prediction = route_short(prediction, base_pred, short_train) # type: ignore
+
+    with instrumentation.stage("evaluate"):
+        metrics = model.get_metrics(test, base_pred.join(prediction, on=["unique_id", "ds"]))
+    with instrumentation.stage("write_test_results"):
+        # export the metrics for user to see
+        metrics.to_pandas().to_markdown(base_dir+config["report"]["path"]+"metrics.md")
 
-# calculate the correct horizon, needed for us if we have data before the 31st
-delta = date.fromisoformat(config["predictions"]["predict_until"]
-                           ) - date.fromisoformat(config["predictions"]["predict_from"])
-HORIZON = int(delta.days)
+        # the testing results, next to the actuals with forecasts.versus_actual(..., kind="test")
+        run = forecasts.write(base_dir+config["forecasts"]["path"],
+                              base_pred.join(prediction, on=["unique_id", "ds"]),
+                              origin=train["ds"].max(), kind="test") # type: ignore
 
-df = data.ingest( base_dir+config["data"]["path"])
-df = data.preprocess(df, end_date=config["predictions"]["predict_from"])
+    print("Metrics: \n", metrics)
+    return run, model, df # type: ignore
 
-# Train test splitt and model eval
-train, test = data.train_test_split(df, config["predictions"]["predict_from"], HORIZON)
 
-train, future_features = data.add_features(train, HORIZON) # turns out no features needed
+def forecast(config: dict, run: str | None = None, model=None,
+             df: pl.DataFrame | None = None, deadline: str | None = None) -> None:
+    """fits the final model on all data and writes the forecast of the horizon
 
-model = FinalModel(HORIZON)
-baseline = BaseLineModel()
+    run, model and df are passed on from ``evaluate`` in the all command. With a
+    deadline the final model trains in its own process next to the statistical
+    fallback and the fallback is published if the final model is not done in time,
+    see modules/deadline.py
+    """
+    if df is None:
+        df = data.collect(load_data(config))
+    # only the rows not already computed for the test fit are computed here
+    features_df, future_features = data.add_features(df, horizon(config),
+                                                     config["features"]["use"],
+                                                     config["features"]["params"])
+    long_df, short_df = data.split_short(features_df, min_length(config))
+    meta = {"published": "final"}
+    if deadline:
+        from modules import deadline as budget # pylint: disable=import-outside-toplevel
+        settings = config["deadline"]
+        jan_pred, meta = budget.forecast_with_deadline(
+            functools.partial(final_model, config), long_df, # type: ignore
+            only(future_features, long_df), horizon(config), budget.parse_deadline(deadline),
+            history=base_dir+settings["history"], fallback_models=settings["fallback_models"],
+            margin=settings["margin"], reserve=settings["reserve"],
+            fallback_jobs=settings["fallback_jobs"],
+        )
+    else:
+        model = model or final_model(config)
+        model.fit(long_df)
+        jan_pred = model.predict(only(future_features, long_df))
+    if not short_df.is_empty(): # type: ignore
+        from modules.baseline import BaseLineModel # pylint: disable=import-outside-toplevel
+        base_model = BaseLineModel(**config["baseline"])
+        base_model.fit(short_df.select("unique_id", "ds", "y")) # type: ignore
+        jan_pred = route_short(jan_pred, base_model.predict(horizon(config), None),
+                               short_df) # type: ignore
 
-model.fit(train)
-baseline.fit(train)
+    with instrumentation.stage("write_predictions") as record:
+        record.update(meta)
+        forecasts.write(base_dir+config["forecasts"]["path"], jan_pred, origin=df["ds"].max(),
+                        run=run, meta=meta) # type: ignore
+        # the newest forecast only, all vintages are in the forecast store
+        jan_pred.write_parquet(base_dir+config["predictions"]["path"]
+                               +"script_january_pred.parquet")
+        with open(base_dir+config["predictions"]["path"]+"script_january_pred.json", "w",
+                  encoding="utf-8") as f: # which model was published and why
+            json.dump(meta, f, indent=2, default=str)
+        if config["forecasts"]["export_csv"]:
+            jan_pred.write_csv(base_dir+config["predictions"]["path"]+"script_january_pred.csv")
 
-prediction = model.predict( future_features)
-base_pred = baseline.predict(HORIZON, future_features)
 
-metrics = model.get_metrics(test, base_pred.join(prediction, on=["unique_id", "ds"]))
-metrics.to_pandas().to_markdown("./metrics.md") # export the metrics for user to see
+def baseline(config: dict) -> None:
+    """forecasts the horizon with the seasonal naive baseline only"""
+    from modules.baseline import BaseLineModel # pylint: disable=import-outside-toplevel
+    df = data.collect(load_data(config))
+    model = BaseLineModel(**config["baseline"])
+    model.fit(df)
+    pred = model.predict(horizon(config), None)
+    with instrumentation.stage("write_predictions"):
+        forecasts.write(base_dir+config["forecasts"]["path"], pred, origin=df["ds"].max(),
+                        kind="baseline") # type: ignore
+    print(f"Baseline forecast of {pred['unique_id'].n_unique()} series written")
 
-print("Metrics: \n", metrics)
 
-base_pred.join(prediction, on=["unique_id", "ds"]
-        ).join(test, on=["unique_id", "ds"]
-        ).write_parquet("../"+config["predictions"]["path"]+"script_test_pred.parquet"
-        ) # write the testing results
+def main() -> None:
+    """runs the chosen command"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", nargs="?", default="all", choices=COMMANDS)
+    parser.add_argument("--config", default=os.path.join(scripts_dir_path, "config.toml"))
+    parser.add_argument("--deadline", default=None,
+                        help='publish by then, e.g. "06:30", "+3600" (seconds) or iso datetime,'
+                             " the forecast falls back to the statistical models if needed")
+    args = parser.parse_args()
+    config = load_config(args.config)
 
-# Predict January
+    report = instrumentation.start_run(profile_stage=config["report"]["profile_stage"] or None,
+                                       profiler=config["report"]["profiler"])
+    if args.command == "all":
+        run, model, df = evaluate(config)
+        # with a deadline the final model is trained again in its own process
+        forecast(config, run, None if args.deadline else model, df, deadline=args.deadline)
+    elif args.command == "forecast":
+        forecast(config, deadline=args.deadline)
+    else:
+        {"ingest": ingest, "evaluate": evaluate, "baseline": baseline}[args.command](config)
+    # next to metrics.md, per stage time, memory and counts
+    report.save(base_dir+config["report"]["path"]+"run_report.json")
 
-features_df, future_features = data.add_features(df, HORIZON) # turns out no features needed
-model.fit(features_df)
-jan_pred = model.predict(future_features)
 
-jan_pred.write_parquet("../"+config["predictions"]["path"]+"script_january_pred.parquet")
-jan_pred.write_csv("../"+config["predictions"]["path"]+"script_january_pred.csv")
+if __name__ == "__main__":
+    main()
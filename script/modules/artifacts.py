@@ -0,0 +1,127 @@
+"""Content-addressed store for trained NeuralForecast objects
+
+Every artifact lives in ``<artifact_dir>/<key>/`` where the key is a hash of the
+hyperparameters, the code version and the training data. The model family (the
+hash of only hyperparameters and code) is kept in ``meta.json`` so the newest model
+of the same family can be found to warm-start from when only new days were added.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import neuralforecast
+from neuralforecast import NeuralForecast
+import polars as pl
+
+META_FILE = "meta.json"
+# settings that only change where/how fast a model trains, not the model itself
+_RUNTIME_PARAMS = ("callbacks", "accelerator", "devices", "dataloader_kwargs")
+
+
+def _stable(value):
+    """json-able version of a hyperparameter, objects are represented by their class"""
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_stable(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _stable(v) for k, v in value.items()}
+    return f"{type(value).__module__}.{type(value).__qualname__}"
+
+
+def family_key(params: dict, code: object | None = None) -> str:
+    """hash of the hyperparameters and the code version
+
+    Args:
+        params (dict): the model hyperparameters
+        code (object | None): module or class whose source is part of the version
+
+    Returns:
+        str: hex digest
+    """
+    payload = {
+        "params": _stable({k: v for k, v in params.items() if k not in _RUNTIME_PARAMS}),
+        "neuralforecast": neuralforecast.__version__,
+        "code": hashlib.sha256(inspect.getsource(code).encode()).hexdigest() if code else "",
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def data_summary(df: pl.DataFrame) -> dict:
+    """range, series and a content hash of training data in nixtla format"""
+    ids = df["unique_id"].unique().sort()
+    return {
+        "start": str(df["ds"].min()),
+        "end": str(df["ds"].max()),
+        "rows": df.height,
+        "series": hashlib.sha256("\n".join(ids.cast(pl.String)).encode()).hexdigest()[:16],
+        "content": str(df.select("unique_id", "ds", "y").hash_rows(seed=0).sum()),
+    }
+
+
+def artifact_key(family: str, data: dict) -> str:
+    """key of one trained model, see ``family_key`` and ``data_summary``"""
+    payload = json.dumps({"family": family, **data}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def load(artifact_dir: str, key: str) -> NeuralForecast | None:
+    """the stored model of key or None if it was never trained"""
+    path = os.path.join(artifact_dir, key)
+    if not os.path.exists(os.path.join(path, META_FILE)):
+        return None
+    return NeuralForecast.load(path)
+
+
+def read_meta(artifact_dir: str, key: str) -> dict:
+    """the meta data stored with the model of key"""
+    with open(os.path.join(artifact_dir, key, META_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save(model: NeuralForecast, artifact_dir: str, key: str, family: str, data: dict) -> None:
+    """stores a fitted model incl. scalers and training data under key
+
+    data is kept as meta data, see ``data_summary``, extra entries are allowed.
+    """
+    path = os.path.join(artifact_dir, key)
+    model.save(path, overwrite=True, save_dataset=True)
+    with open(os.path.join(path, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"family": family, **data}, f) # written last, marks a complete artifact
+
+
+def _metas(artifact_dir: str) -> list[tuple[str, dict]]:
+    """(key, meta) of all complete artifacts"""
+    if not os.path.isdir(artifact_dir):
+        return []
+    metas = []
+    for key in os.listdir(artifact_dir):
+        meta_path = os.path.join(artifact_dir, key, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                metas.append((key, json.load(f)))
+    return metas
+
+
+def latest_for_warm_start(artifact_dir: str, family: str, data: dict) -> str | None:
+    """key of the newest model of the family trained on an earlier part of the same data
+
+    Only models of the same series and start date whose data ends before the new data
+    qualify, i.e. the new data only added days.
+    """
+    best, best_end = None, ""
+    for key, meta in _metas(artifact_dir):
+        if (meta["family"] == family and meta["series"] == data["series"]
+                and meta["start"] == data["start"] and best_end < meta["end"] < data["end"]):
+            best, best_end = key, meta["end"]
+    return best
+
+
+def latest(artifact_dir: str) -> str | None:
+    """key of the stored model trained on the most recent data, None if there is none"""
+    best, best_end = None, ""
+    for key, meta in _metas(artifact_dir):
+        if meta["end"] > best_end:
+            best, best_end = key, meta["end"]
+    return best
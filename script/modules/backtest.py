@@ -0,0 +1,129 @@
+"""Rolling-origin backtesting of the final and the baseline model
+
+The cutoffs (last training day of every window) are spaced step days apart and end h
+days before the data ends. Windows are grouped by refit_every: the model is fitted
+once at the first cutoff of a group and reused to predict the following windows of the
+group from their longer history. Every group is one task of a process pool.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+import polars as pl
+
+from . import dataprocessing as data
+from .baseline import BaseLineModel
+
+MODELS = ("final", "baseline")
+
+
+def cutoffs(df: pl.DataFrame, n_windows: int, h: int, step: int | None = None
+            ) -> list[date]:
+    """last training day of each window, oldest first
+
+    Args:
+        df (pl.DataFrame): data in nixtla format
+        n_windows (int): number of windows
+        h (int): forecast horizon (days)
+        step (int | None): days between the cutoffs, h if None
+
+    Returns:
+        list[date]: the cutoffs
+    """
+    step = step or h
+    last = df["ds"].max() - timedelta(h) # type: ignore
+    return [last - timedelta(step*i) for i in reversed(range(n_windows))]
+
+
+def _train_window(df: pl.DataFrame, cutoff: date, train_length: int | None) -> pl.DataFrame:
+    """expanding window if train_length is None, else rolling with train_length days"""
+    train = df.filter(pl.col("ds") <= cutoff)
+    if train_length:
+        train = train.filter(pl.col("ds") > cutoff - timedelta(train_length))
+    return train
+
+
+def _run_group(model_name: str, model_kwargs: dict, df: pl.DataFrame,
+               group: list[tuple[int, date]], h: int, train_length: int | None,
+               feature_names: tuple[str, ...] = (), feature_params: dict | None = None
+               ) -> pl.DataFrame:
+    """fits one model at the first cutoff of group and predicts every window of it"""
+    first_cutoff = group[0][1]
+    if model_name == "final":
+        from .modelling import FinalModel # pylint: disable=import-outside-toplevel
+        model = FinalModel(h, **model_kwargs)
+        train, _ = data.add_features(_train_window(df, first_cutoff, train_length), h,
+                                     feature_names, feature_params)
+        model.fit(train) # type: ignore
+    else:
+        model = BaseLineModel(**model_kwargs)
+        model.fit(_train_window(df, first_cutoff, train_length))
+
+    results = []
+    for window, cutoff in group:
+        history = _train_window(df, cutoff, train_length)
+        if model_name == "final": # the features of the history and the future of the window
+            history, future = data.add_features(history, h, feature_names, feature_params)
+            pred = model.predict(future, history) # type: ignore
+        else:
+            pred = model.predict(h, None, history) # type: ignore
+        value_cols = [c for c in pred.columns if c not in ("unique_id", "ds")]
+        test = df.filter(pl.col("ds") > cutoff, pl.col("ds") <= cutoff + timedelta(h))
+        results.append(
+            pred.unpivot(on=value_cols, index=["unique_id", "ds"], variable_name="model",
+                         value_name="y_hat")
+            .join(test.select("unique_id", "ds", "y"), on=["unique_id", "ds"], how="inner")
+            .select(
+                pl.lit(window).alias("window"),
+                pl.lit(cutoff).alias("cutoff"),
+                pl.lit(first_cutoff).alias("fitted_at"),
+                # e.g. "baseline" or, with several baseline models, "baseline_Naive"
+                pl.lit(model_name).alias("model") if len(value_cols) == 1
+                else pl.format(f"{model_name}_{{}}", "model").alias("model"),
+                "unique_id", "ds", "y", pl.col("y_hat").cast(pl.Float64),
+            )
+        )
+    return pl.concat(results)
+
+
+def run_backtest(df: pl.DataFrame, h: int, n_windows: int, step: int | None = None,
+                 train_length: int | None = None, refit_every: int = 1,
+                 models: tuple[str, ...] = MODELS, model_kwargs: dict | None = None,
+                 processes: int = 1, feature_names: tuple[str, ...] = (),
+                 feature_params: dict | None = None) -> pl.DataFrame:
+    """backtests the models over n_windows origins in a process pool
+
+    Args:
+        df (pl.DataFrame): preprocessed data in nixtla format
+        h (int): forecast horizon (days)
+        n_windows (int): number of origins
+        step (int | None): days between origins, h if None
+        train_length (int | None): rolling training window in days, None for expanding
+        refit_every (int): fit a new model every refit_every windows, reuse it in between
+        models (tuple[str, ...]): any of "final", "baseline"
+        model_kwargs (dict | None): model name -> keyword arguments for its constructor
+        processes (int): worker processes
+        feature_names (tuple[str, ...]): features of the final model, see features.py
+        feature_params (dict | None): params of the features
+
+    Returns:
+        pl.DataFrame: window, cutoff, fitted_at, model, unique_id, ds, y, y_hat, model is
+        <model>_<column> for models with several prediction columns
+    """
+    unknown = set(models) - set(MODELS)
+    if unknown:
+        raise ValueError(f"models must be in {MODELS}, got {sorted(unknown)}")
+    model_kwargs = model_kwargs or {}
+    windows = list(enumerate(cutoffs(df, n_windows, h, step)))
+    groups = [windows[i:i+refit_every] for i in range(0, len(windows), refit_every)]
+    tasks = [(name, model_kwargs.get(name, {}), df, group, h, train_length,
+              tuple(feature_names), feature_params) for name in models for group in groups]
+
+    if processes <= 1:
+        results = [_run_group(*task) for task in tasks]
+    else: # spawn, forking a process that already uses polars/torch threads can deadlock
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn")
+                                 ) as pool:
+            results = list(pool.map(_run_group, *zip(*tasks)))
+
+    return pl.concat(results).sort(["model", "window", "unique_id", "ds"])
@@ -0,0 +1,144 @@
+"""The baseline models, they only need polars and statsforecast (no torch)
+
+The simple models (SeasonalNaive, Naive, WindowAverage, SeasonalWindowAverage) are
+computed for all series at once with polars window expressions on the last days of
+every series, which takes seconds for 100k series. Heavier statsforecast models (e.g.
+AutoETS) are fitted by StatsForecast on all cores and joined to the same frame.
+"""
+
+import polars as pl
+
+from . import metrics
+from .instrumentation import timed
+
+MODELS = ("SeasonalNaive", "Naive", "WindowAverage", "SeasonalWindowAverage")
+_SEASONAL = ("SeasonalNaive", "SeasonalWindowAverage")
+
+
+class BaseLineModel():
+    """Seasonal naive model with season length of 7 default
+
+    Args:
+        season_length (int | list[int]): one or more season lengths, the seasonal models
+        of the first are named like in statsforecast, the others get _<season length>
+        models (tuple[str, ...]): any of MODELS, computed with polars
+        window_size (int): values (or seasons) averaged by the window average models
+        stats_models (tuple[str, ...]): statsforecast models fitted by StatsForecast,
+        e.g. ("AutoETS",), with the first season length
+        n_jobs (int): processes of StatsForecast, -1 for all cores
+    """
+    def __init__(self, season_length: int | list[int] = 7,
+                 models: tuple[str, ...] | list[str] = ("SeasonalNaive",), window_size: int = 7,
+                 stats_models: tuple[str, ...] | list[str] = (), n_jobs: int = -1) -> None:
+        unknown = set(models) - set(MODELS)
+        if unknown:
+            raise ValueError(f"models must be in {MODELS}, got {sorted(unknown)}")
+        self.season_lengths = [season_length] if isinstance(season_length, int) \
+            else list(season_length)
+        self.models = list(models)
+        self.window_size = window_size
+        self.history: pl.DataFrame | None = None
+        self.stats = None
+        if stats_models:
+            # pylint: disable=import-outside-toplevel
+            from statsforecast import StatsForecast
+            from statsforecast import models as stats
+            self.stats = StatsForecast(
+                models=[getattr(stats, name)(season_length=self.season_lengths[0])
+                        for name in stats_models],
+                freq='1d', n_jobs=n_jobs)
+
+    def _columns(self) -> list[tuple[str, str, int]]:
+        """output column, model and season length of every polars model"""
+        columns = []
+        for model in self.models:
+            if model not in _SEASONAL:
+                columns.append((model, model, 1))
+                continue
+            for i, season in enumerate(self.season_lengths):
+                columns.append((model if i == 0 else f"{model}_{season}", model, season))
+        return columns
+
+    def _needed(self) -> int:
+        """days of history the polars models look back"""
+        return max(season * (self.window_size if model.endswith("WindowAverage") else 1)
+                   for _, model, season in self._columns())
+
+    def _tail(self, df: pl.DataFrame) -> pl.DataFrame:
+        """the last days of every series, all the polars models need"""
+        return (
+            df.lazy().select("unique_id", "ds", "y")
+            .sort("unique_id", "ds")
+            .group_by("unique_id", maintain_order=True).tail(self._needed())
+            .collect()
+        )
+
+    @timed("BaseLineModel.fit")
+    def fit(self, df: pl.DataFrame)-> None:
+        """fit the baseline model on data in nixtla format"""
+        self.history = self._tail(df)
+        if self.stats is not None:
+            self.stats.fit(df) #type: ignore
+
+    def _forecast(self, history: pl.DataFrame, h: int) -> pl.DataFrame:
+        """the polars models on the tails of the series, h days after each of them"""
+        back = pl.len().over("unique_id") - pl.int_range(pl.len()).over("unique_id")
+        tail = history.lazy().with_columns(back.alias("_back")) # 1 for the last day
+        future = (
+            tail.group_by("unique_id").agg(pl.col("ds").max().alias("_last"))
+            .join(pl.LazyFrame({"_step": range(1, h + 1)}), how="cross")
+            .with_columns((pl.col("_last") + pl.duration(days=pl.col("_step"))).alias("ds"))
+        )
+
+        for column, model, season in self._columns():
+            if model == "Naive":
+                values = tail.filter(pl.col("_back") == 1).select("unique_id", pl.col("y"))
+                keys = ["unique_id"]
+            elif model == "WindowAverage":
+                values = (tail.filter(pl.col("_back") <= self.window_size)
+                          .group_by("unique_id").agg(pl.col("y").mean()))
+                keys = ["unique_id"]
+            else: # the slot of a day within the last season(s), the future repeats them
+                windows = self.window_size if model == "SeasonalWindowAverage" else 1
+                values = (
+                    tail.filter(pl.col("_back") <= season * windows)
+                    .with_columns(((season - pl.col("_back") % season) % season)
+                                  .alias("_slot"))
+                    .group_by("unique_id", "_slot").agg(pl.col("y").mean())
+                )
+                future = future.with_columns(((pl.col("_step") - 1) % season).alias("_slot"))
+                keys = ["unique_id", "_slot"]
+            future = future.join(values.select(*keys, pl.col("y").cast(pl.Float32)
+                                               .alias(column)), on=keys, how="left")
+
+        return (
+            future.select("unique_id", "ds", *(column for column, _, _ in self._columns()))
+            .sort("unique_id", "ds")
+            .collect()
+        )
+
+    @timed("BaseLineModel.predict")
+    def predict(self, h: int, future_features: pl.DataFrame|None,
+                df: pl.DataFrame|None = None) -> pl.DataFrame:
+        """make predictions horizon h in days, outputs in nixtla format
+
+        df is the history to predict from, the training data if None
+        """
+        if df is None and self.history is None:
+            raise ValueError("fit the model or pass the history as df")
+        pred = self._forecast(self.history if df is None else self._tail(df), h) # type: ignore
+        if self.stats is None:
+            return pred
+        if df is not None:
+            stats_pred = self.stats.forecast(df=df, h=h, X_df=future_features) #type: ignore
+        else:
+            stats_pred = self.stats.predict(h, future_features) #type: ignore
+        return pred.join(pl.DataFrame(stats_pred).with_columns(
+            pl.col("unique_id").cast(pred["unique_id"].dtype)), on=["unique_id", "ds"])
+
+    def get_metrics(self, true: pl.DataFrame, predictions: pl.DataFrame) -> pl.DataFrame:
+        """evalutes the model on true data, both must be nixtla format"""
+        return metrics.to_wide(metrics.evaluate(
+            predictions, true,
+            metrics=["mae", "mape", "rmse"], # List the metrics you want
+        ))
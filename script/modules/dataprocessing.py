@@ -1,135 +1,237 @@
 """ Model for processing the Data"""
 
 from datetime import timedelta
-from typing import Tuple
+from typing import Iterable, Tuple
 import polars as pl
 
+from . import features, outliers
+from .instrumentation import timed
 
-def ingest(path: str) -> pl.DataFrame:
+
+NIXTLA_COLUMNS = {"Date": "ds", "Drink": "unique_id", "Views": "y"}
+FILL_STRATEGIES = ("zero", "forward", "interpolate")
+
+
+def compact(df: outliers.Frame, ids: Iterable[str] | None = None) -> outliers.Frame:
+    """narrow dtypes for data in nixtla format: unique_id as Enum, y as Float32
+
+    The ids are stored once instead of a string per row and y has the float32 dtype
+    the models train on, so handing the columns to numpy/torch needs no conversion.
+
+    Args:
+        df (outliers.Frame): data in nixtla format, eager or lazy
+        ids (Iterable[str] | None): all series ids, read from df if None
+
+    Returns:
+        outliers.Frame: df with unique_id Enum (sorted categories, so sorting by id is
+        unchanged) and y Float32, lazy if df was lazy
     """
-    Read pageviews CSV and convert it to long format with a Date column.
+    if ids is None:
+        ids = df.lazy().select(pl.col("unique_id").cast(pl.String).unique()).collect()["unique_id"]
+    return df.with_columns(pl.col("unique_id").cast(pl.String).cast(pl.Enum(sorted(ids))),
+                           pl.col("y").cast(pl.Float32))
+
+@timed("ingest")
+def ingest(path: str, lazy: bool = False, compact_dtypes: bool = False) -> outliers.Frame:
     """
-    df = pl.read_csv(path)
-
-    df_long = (
-        df
-        .unpivot(
-            index=["Date"],
-            variable_name="Drink",
-            value_name="Views"
-        )
-        .with_columns(
-            pl.col("Date").cast(pl.Date)
+    Read pageviews and convert them to long format with a Date column.
+
+    A wide CSV (one column per drink) is unpivoted, a parquet file is expected to
+    already be in long format so the unpivot is skipped completely.
+
+    Args:
+        path (str): path to a wide .csv or a long .parquet file
+        lazy (bool): if True only scan the file and return a LazyFrame, nothing is read
+        until the frame is collected (see ``collect``)
+        compact_dtypes (bool): Enum ids and Float32 values, see ``compact``
+
+    Returns:
+        outliers.Frame: long format data with the columns ds, unique_id, y
+    """
+    if path.endswith(".parquet"):
+        df_long = pl.scan_parquet(path)
+        names = df_long.collect_schema().names()
+        df_long = df_long.rename({old: new for old, new in NIXTLA_COLUMNS.items() if old in names})
+        df_long = df_long.with_columns(pl.col("ds").cast(pl.Date))
+    else:
+        df_long = (
+            pl.scan_csv(path)
+            .unpivot(
+                index=["Date"],
+                variable_name="Drink",
+                value_name="Views"
+            )
+            .with_columns(
+                pl.col("Date").cast(pl.Date)
+            )
+            .rename(NIXTLA_COLUMNS)
         )
+    if compact_dtypes: # the ids of a csv are its header, nothing has to be read for them
+        ids = None if path.endswith(".parquet") else [
+            c for c in pl.scan_csv(path).collect_schema().names() if c != "Date"]
+        df_long = compact(df_long, ids)
+
+    return df_long if lazy else collect(df_long)
+
+def collect(df: outliers.Frame) -> pl.DataFrame:
+    """collects a LazyFrame with the streaming engine, DataFrames are passed through
+
+    Meant to be called once at the model boundary so the whole pipeline before runs lazily.
+    The result is one contiguous chunk, so the models get its columns zero-copy.
+    """
+    if isinstance(df, pl.LazyFrame):
+        df = df.collect(engine="streaming")
+    return df.rechunk()
+
+@timed("collect_all")
+def collect_all(dfs: list[outliers.Frame | None]) -> list[pl.DataFrame | None]:
+    """collects several frames of the same plan at once so shared work is only done once
+
+    Eager frames and None (e.g. missing future features) are passed through.
+    """
+    lazy = [i for i, df in enumerate(dfs) if isinstance(df, pl.LazyFrame)]
+    collected = pl.collect_all([dfs[i] for i in lazy], engine="streaming") # type: ignore
+    result = list(dfs)
+    for i, df in zip(lazy, collected):
+        result[i] = df
+    result = [df.rechunk() if isinstance(df, pl.DataFrame) else df for df in result]
+    return result # type: ignore
+
+def coverage(df: outliers.Frame) -> outliers.Frame:
+    """start, end, days, observed and missing days and the coverage of every series
+
+    A series starts at its first and ends at its last day with a value, so pages that
+    were added later are not counted as missing before they existed.
+    """
+    days = (pl.col("end") - pl.col("start")).dt.total_days() + 1
+    return (
+        df.filter(pl.col("y").is_not_null())
+        .group_by("unique_id")
+        .agg(pl.col("ds").min().alias("start"), pl.col("ds").max().alias("end"),
+             pl.col("ds").n_unique().alias("observed"))
+        .with_columns(days.alias("days"))
+        .with_columns((pl.col("days") - pl.col("observed")).alias("missing"),
+                      (pl.col("observed") / pl.col("days")).alias("coverage"))
+        .sort("unique_id")
     )
-    df_long = df_long.rename({"Date": "ds", "Drink": "unique_id", "Views": "y"})
 
-    return df_long
+@timed("fill_gaps")
+def fill_gaps(df: outliers.Frame, strategy: str = "zero") -> outliers.Frame:
+    """completes every series to one row per day between its own first and last value
+
+    All series are expanded in one grouped pass: the daily range of every series is
+    built from its first and last observed day and the data is joined onto it, so rows
+    before a series started (nulls of the wide csv) are dropped and dropped days show up.
+
+    Args:
+        df (outliers.Frame): long format data, eager or lazy
+        strategy (str): one of FILL_STRATEGIES, how missing days are filled: zero, the
+        last value before (forward) or linearly between the neighbouring values
 
-def preprocess(df: pl.DataFrame, end_date: None|str = None) -> pl.DataFrame:
+    Returns:
+        outliers.Frame: gap free df sorted by unique_id, ds, lazy if df was lazy
+    """
+    if strategy not in FILL_STRATEGIES:
+        raise ValueError(f"strategy must be one of {FILL_STRATEGIES}, got '{strategy}'")
+    y_dtype = df.collect_schema()["y"]
+    observed = df.filter(pl.col("y").is_not_null())
+    grid = (
+        observed.group_by("unique_id")
+        .agg(pl.date_range(pl.col("ds").min(), pl.col("ds").max(), "1d").alias("ds"))
+        .explode("ds")
+    )
+    if strategy == "zero":
+        filled = pl.col("y").fill_null(0)
+    elif strategy == "forward":
+        filled = pl.col("y").forward_fill().over("unique_id")
+    else:
+        filled = pl.col("y").interpolate().over("unique_id")
+    df_filled = (
+        grid.join(observed, on=["unique_id", "ds"], how="left")
+        .sort("unique_id", "ds")
+        .with_columns(filled)
+    )
+    if y_dtype == pl.Float32: # keep the compact dtype, interpolating computes in Float64
+        df_filled = df_filled.with_columns(pl.col("y").cast(pl.Float32))
+    return df_filled
+
+def split_short(df: outliers.Frame, min_length: int) -> Tuple[outliers.Frame, outliers.Frame]:
+    """splits off the series with fewer than min_length days, e.g. for the baseline
+
+    Returns:
+        Tuple[outliers.Frame, outliers.Frame]: long enough series, short series
+    """
+    length = pl.len().over("unique_id")
+    return df.filter(length >= min_length), df.filter(length < min_length)
+
+@timed("preprocess")
+def preprocess(df: outliers.Frame, end_date: None|str = None, outlier_method: str = "iqr",
+               exclude: Iterable[str] = ("Pumpkin spice latte",), fill: str | None = None,
+               **outlier_params) -> outliers.Frame:
     """takes long format and processes it, i.e. capping outliers, renaming for nixtla
 
     Args:
-        df (pl.DataFrame): long format data
+        df (outliers.Frame): long format data, eager or lazy
         end_date (None|str): None if all data is to be used,
         datestring if data should be limited to certain date, inclusive
+        outlier_method (str): one of outliers.METHODS, iqr by default
+        exclude (Iterable[str]): series that are not capped, e.g. because of a new trend
+        fill (str | None): strategy of ``fill_gaps``, None if every series is complete
+        **outlier_params: passed on to outliers.cap_outliers, e.g. factor=1.5
 
     Returns:
-        pl.DataFrame: processed df still long
+        outliers.Frame: processed df still long, lazy if df was lazy
     """
-    df_without_pumpkin_spice, df_pumpkin_spice = _filter_out_drink(df, "Pumpkin spice latte")
-    df_iqr = _cap_outliers_iqr(df_without_pumpkin_spice, factor=1.5)
-    df_capped = _add_drink_back(df_iqr, df_pumpkin_spice)
-    df_capped = df_capped.sort(['unique_id', 'ds'])
-
-    if end_date:
+    if fill: # series of their own length without gaps before the (windowed) capping
+        df = fill_gaps(df, fill)
+    schema = df.collect_schema()
+    if isinstance(schema["unique_id"], pl.Enum): # only ids of the data can be compared
+        exclude = [e for e in exclude if e in schema["unique_id"].categories]
+    df_capped = outliers.cap_outliers(df, outlier_method, exclude=exclude, **outlier_params)
+    if schema["y"] == pl.Float32: # capping computes in Float64, keep the compact dtype
+        df_capped = df_capped.with_columns(pl.col("y").cast(pl.Float32))
+
+    if end_date: # filter before sorting so only the kept rows are sorted
         end = pl.lit(end_date).str.to_date()
         df_capped = df_capped.filter(pl.col("ds") <= end)
 
-    return df_capped
+    return df_capped.sort(['unique_id', 'ds'])
 
-def train_test_split(df: pl.DataFrame, test_end: str = "2025-12-01", test_length: int = 31
-                    )-> Tuple[pl.DataFrame, pl.DataFrame]:
+@timed("train_test_split")
+def train_test_split(df: outliers.Frame, test_end: str = "2025-12-01", test_length: int = 31
+                    )-> Tuple[outliers.Frame, outliers.Frame]:
     """splits the data into train and test, it also limits to how far the data can go
 
     Args:
-        df (pl.DataFrame): df to split
+        df (outliers.Frame): df to split, lazy frames stay lazy and share one plan
         test_start (str): where the test data starts.
         test_length (int) = how many days are in the test set
     Returns:
-        Tuple[pl.DataFrame, pl.DataFrame]: train, test
+        Tuple[outliers.Frame, outliers.Frame]: train, test
     """
     test_start = pl.lit(test_end).str.to_date() - timedelta(test_length-1)
     return df.filter(pl.col("ds") < test_start), df.filter(pl.col("ds") >= test_start)
 
-def add_features(df: pl.DataFrame, h:int = 31 # pylint: disable=unused-argument
-                 ) ->Tuple[pl.DataFrame, pl.DataFrame |None]:
-    """adds features to a df and returns a future df for the horizon of the featues"""
-    return df, None # the best model has no features ¯\(°_o)/¯
+@timed("add_features")
+def add_features(df: outliers.Frame, h:int = 31, names: Iterable[str] = (),
+                 params: dict | None = None) ->Tuple[outliers.Frame, outliers.Frame |None]:
+    """adds features to a df and returns a future df for the horizon of the featues
 
-
-def _filter_out_drink(df: pl.DataFrame, drink_name: str) -> Tuple[pl.DataFrame, pl.DataFrame]:
-    """
-    Filter out a specific drink from the dataframe
-    
     Args:
-        df: Input dataframe
-        drink_name: Name of the drink to filter out (Drink)
-        
-    Returns:
-        Tuple of (df_without_drink, df_drink_only)
-    """
-    df_without_drink = df.filter(pl.col("unique_id") != drink_name)
-    df_drink_only = df.filter(pl.col("unique_id") == drink_name)
-
-    return df_without_drink, df_drink_only
+        df (outliers.Frame): data in nixtla format
+        h (int): forecast horizon (days)
+        names (Iterable[str]): features from the registry in features.py, none by default
+        params (dict | None): feature name -> its params, e.g. {"fourier": {"k": 3}}
 
-def _add_drink_back(df_processed: pl.DataFrame, df_drink: pl.DataFrame) -> pl.DataFrame:
-    """
-    Add a drink back into the processed dataframe
-    
-    Args:
-        df_processed: Processed dataframe (after outlier capping, etc.)
-        df_drink: Drink dataframe to add back
-        
     Returns:
-        Combined dataframe with drink added back
+        Tuple[outliers.Frame, outliers.Frame |None]: df with features, future df or None
     """
-    # Cast df_drink's 'Views' column to match df_processed's type
-    df_drink = df_drink.with_columns(
-        pl.col("y").cast(df_processed["y"].dtype)
-    )
-    df_combined = pl.concat([df_processed, df_drink])
-
-    # Sort by Drink and Date to keep it organized
-    df_combined = df_combined.sort(["unique_id", "ds"])
+    names = list(names)
+    if not names:
+        return df, None # the best model has no features ¯\(°_o)/¯
+    return features.build(collect(df), h, names, params)
 
-    return df_combined
 
-def _cap_outliers_iqr(df, column='y', group_by='unique_id', factor=1.5):
+def _cap_outliers_iqr(df, column='y', group_by='unique_id', factor=1.5, exclude=()):
     """Cap outliers using IQR method for each drink separately"""
-
-    result = df.clone()
-
-    for drink in df[group_by].unique():
-        mask = df[group_by] == drink
-        values = df.filter(mask)[column]
-
-        q1 = values.quantile(0.25)
-        q3 = values.quantile(0.75)
-        iqr = q3 - q1
-
-        lower_bound = q1 - factor * iqr
-        upper_bound = q3 + factor * iqr
-
-        # Cap the values
-        result = result.with_columns(
-            pl.when((pl.col(group_by) == drink) & (pl.col(column) > upper_bound))
-            .then(upper_bound)
-            .when((pl.col(group_by) == drink) & (pl.col(column) < lower_bound))
-            .then(lower_bound)
-            .otherwise(pl.col(column))
-            .alias(column)
-        )
-
-    return result
+    return outliers.cap_outliers(df, "iqr", column, group_by, exclude, factor=factor)
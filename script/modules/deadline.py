@@ -0,0 +1,168 @@
+"""Forecasting against a wall-clock deadline with a statistical fallback
+
+The final model trains in a separate process while the statistical fallback
+(seasonal naive and optionally more statsforecast models) runs in this one. The final
+forecast is published only if it is done before the deadline, else the training is
+stopped and the fallback is published, with the reason in the returned metadata.
+Training times of earlier runs (seconds per row, in a json history) estimate whether
+the final model can make it at all, if not it is not even started.
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable
+import polars as pl
+
+from .baseline import BaseLineModel
+from .instrumentation import timed
+
+
+def parse_deadline(value: str, now: datetime | None = None) -> datetime:
+    """"06:30" (the next 06:30), "+3600" (seconds from now) or an iso datetime"""
+    now = now or datetime.now()
+    if value.startswith("+"):
+        return now + timedelta(seconds=float(value[1:]))
+    if len(value) <= 5 and ":" in value:
+        hour, minute = (int(part) for part in value.split(":"))
+        deadline = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        return deadline if deadline > now else deadline + timedelta(days=1)
+    return datetime.fromisoformat(value)
+
+
+def read_history(path: str) -> list[dict]:
+    """the recorded training runs, oldest first"""
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def record(path: str, rows: int, seconds: float, status: str) -> None:
+    """appends one training run to the history"""
+    history = read_history(path)
+    history.append({"time": datetime.now().isoformat(timespec="seconds"), "rows": rows,
+                    "seconds": seconds, "status": status})
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(history, f, indent=1)
+
+
+def estimate_seconds(path: str, rows: int, last: int = 5, margin: float = 1.25
+                     ) -> float | None:
+    """expected training time for rows rows from the median seconds per row of the last
+    finished runs, times the safety margin, None without history"""
+    finished = [run for run in read_history(path) if run["status"] == "finished"][-last:]
+    if not finished:
+        return None
+    per_row = statistics.median(run["seconds"] / max(run["rows"], 1) for run in finished)
+    return per_row * rows * margin
+
+
+def _final_job(build: Callable, train: pl.DataFrame, future: pl.DataFrame | None,
+               out_path: str) -> None:
+    """fits and predicts the final model, runs in its own process"""
+    model = build()
+    model.fit(train)
+    model.predict(future).write_parquet(out_path)
+
+
+@timed("fallback")
+def fallback_forecast(df: pl.DataFrame, h: int, models: list[str] | tuple[str, ...] = (),
+                      season_length: int = 7, alias: str = "NHITS", n_jobs: int = 1
+                      ) -> tuple[pl.DataFrame, str]:
+    """the first of the named statsforecast models (e.g. ["AutoETS"]), the seasonal naive
+    where it has no value or if none is named, in a column named like the final model
+
+    n_jobs bounds the StatsForecast processes, they run next to the final model training
+
+    Returns:
+        tuple[pl.DataFrame, str]: unique_id, ds, alias and the name of the published model
+    """
+    model = BaseLineModel(season_length, stats_models=models, n_jobs=n_jobs)
+    model.fit(df.select("unique_id", "ds", "y"))
+    pred = model.predict(h, None)
+    name = models[0] if models else "SeasonalNaive"
+    return pred.select("unique_id", "ds", pl.coalesce(name, "SeasonalNaive").alias(alias)), name
+
+
+@timed("forecast_with_deadline")
+def forecast_with_deadline(build: Callable, train: pl.DataFrame, future: pl.DataFrame | None,
+                           h: int, deadline: datetime, history: str,
+                           fallback_models: list[str] | tuple[str, ...] = (),
+                           margin: float = 1.25, reserve: float = 30, alias: str = "NHITS",
+                           fallback_jobs: int = 1) -> tuple[pl.DataFrame, dict]:
+    """the final forecast if it is done reserve seconds before the deadline, else the
+    fallback
+
+    Args:
+        build (Callable): returns the unfitted final model, must be picklable (spawn)
+        train (pl.DataFrame): training data with features
+        future (pl.DataFrame | None): future features
+        h (int): forecast horizon (days)
+        deadline (datetime): when the forecast has to be published
+        history (str): json file with the training times of earlier runs
+        fallback_models (list[str] | tuple[str, ...]): statsforecast models next to the
+        seasonal naive, the first is published if the fallback is
+        margin (float): safety factor on the estimated training time
+        reserve (float): seconds kept free before the deadline to write the outputs
+        alias (str): the forecast column of the final model, the fallback is published
+        under the same name
+        fallback_jobs (int): StatsForecast processes of the fallback models, they share
+        the cpus with the final model training
+
+    Returns:
+        tuple[pl.DataFrame, dict]: the published forecast and its metadata (published
+        tier and model, reason, estimated and used seconds, deadline)
+    """
+    until = deadline - timedelta(seconds=reserve)
+    estimate = estimate_seconds(history, train.height, margin=margin)
+    meta = {"deadline": deadline.isoformat(timespec="seconds"), "estimated_seconds": estimate}
+    remaining = (until - datetime.now()).total_seconds()
+
+    process, out_dir, out_path, start = None, "", "", time.perf_counter()
+    if estimate is not None and estimate > remaining:
+        meta["reason"] = (f"estimated training time {estimate:.0f}s exceeds the "
+                          f"{max(remaining, 0):.0f}s left, the final model was not started")
+    else:
+        out_dir = tempfile.mkdtemp()
+        out_path = os.path.join(out_dir, "final.parquet")
+        process = multiprocessing.get_context("spawn").Process(
+            target=_final_job, args=(build, train, future, out_path), daemon=True)
+        process.start()
+
+    try:
+        fallback, fallback_model = fallback_forecast(train, h, fallback_models, alias=alias,
+                                                     n_jobs=fallback_jobs)
+        if process is not None:
+            process.join(max((until - datetime.now()).total_seconds(), 0))
+            seconds = time.perf_counter() - start
+            meta["final_seconds"] = seconds
+            if process.is_alive():
+                process.terminate()
+                process.join()
+                record(history, train.height, seconds, "timeout") # a lower bound of the time
+                meta["reason"] = f"the final model was not done {reserve:.0f}s before the deadline"
+            elif process.exitcode != 0 or not os.path.exists(out_path):
+                record(history, train.height, seconds, "failed")
+                meta["reason"] = f"the final model failed with exit code {process.exitcode}"
+            else:
+                record(history, train.height, seconds, "finished")
+                meta.update(published="final", model=alias,
+                            reason="the final model was done in time")
+                return pl.read_parquet(out_path), meta
+    finally:
+        if process is not None and process.is_alive(): # e.g. the fallback raised
+            process.terminate()
+            process.join()
+        if out_dir:
+            shutil.rmtree(out_dir, ignore_errors=True)
+
+    meta.update(published="fallback", model=fallback_model)
+    print(f"Publishing the fallback forecast ({fallback_model}): {meta['reason']}")
+    return fallback, meta
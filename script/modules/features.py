@@ -0,0 +1,157 @@
+"""Registry of the features add_features can compute
+
+Every feature declares the columns it needs, the columns it produces and whether
+it is known in advance (future=True), i.e. can be part of the futr_df. All features
+are functions of (unique_id, ds) only, so they are computed for history and horizon
+in one lazy pass and memoized per row: a later call (e.g. the final refit after the
+test fit) only computes the rows that are not cached yet.
+"""
+
+import json
+import math
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Callable, Iterable
+import polars as pl
+
+from . import holiday_features
+
+
+@dataclass(frozen=True)
+class Feature:
+    """a registered feature
+
+    apply adds the columns to a LazyFrame with at least the inputs, columns lists them.
+    Both get the feature params, plus "start"/"end" (the date range being computed).
+    """
+    name: str
+    apply: Callable[[pl.LazyFrame, dict], pl.LazyFrame]
+    columns: Callable[[dict], list[str]]
+    inputs: tuple[str, ...] = ("ds",)
+    future: bool = True
+
+
+REGISTRY: dict[str, Feature] = {}
+_CACHE: dict[tuple[str, str], pl.DataFrame] = {}
+
+
+def register(name: str, columns: Callable[[dict], list[str]], inputs: tuple[str, ...] = ("ds",),
+             future: bool = True) -> Callable:
+    """decorator that registers an apply function as feature name"""
+    def decorator(apply: Callable[[pl.LazyFrame, dict], pl.LazyFrame]) -> Callable:
+        REGISTRY[name] = Feature(name, apply, columns, inputs, future)
+        return apply
+    return decorator
+
+
+def _fourier_columns(params: dict) -> list[str]:
+    season_length, k = params.get("season_length", 7), params.get("k", 3)
+    return [f"{f}{i}_{season_length}" for i in range(1, k+1) for f in ("sin", "cos")]
+
+
+@register("fourier", _fourier_columns)
+def _fourier(lf: pl.LazyFrame, params: dict) -> pl.LazyFrame:
+    """sin/cos terms of the day with period season_length"""
+    season_length, k = params.get("season_length", 7), params.get("k", 3)
+    t = pl.col("ds").cast(pl.Int64) * (2 * math.pi / season_length)
+    return lf.with_columns(
+        expr
+        for i in range(1, k+1)
+        for expr in ((i * t).sin().alias(f"sin{i}_{season_length}"),
+                     (i * t).cos().alias(f"cos{i}_{season_length}"))
+    )
+
+
+@register("trend", lambda params: ["trend"])
+def _trend(lf: pl.LazyFrame, params: dict) -> pl.LazyFrame:
+    """days since a fixed origin, the same value for a day in every run"""
+    origin = date.fromisoformat(params.get("origin", "2020-07-01"))
+    return lf.with_columns(((pl.col("ds") - origin).dt.total_days() + 1).alias("trend"))
+
+
+@register("holidays", lambda params: ["is_holiday", "days_to_holiday", "days_since_holiday",
+                                      "num_holidays"], inputs=("unique_id", "ds"))
+def _holidays(lf: pl.LazyFrame, params: dict) -> pl.LazyFrame:
+    """holiday features of the locale of every series, see holiday_features"""
+    return (
+        holiday_features.add_holiday_features(lf.collect(), params.get("locales"),
+                                              params.get("default_locale", "US"),
+                                              params.get("cache_dir"))
+        .with_columns(pl.col("is_holiday").cast(pl.Int8))
+        .drop("holiday_name")
+        .lazy()
+    )
+
+
+def columns(names: Iterable[str], params: dict | None = None, future_only: bool = False
+            ) -> list[str]:
+    """all columns the features produce, e.g. for futr_exog_list
+
+    Raises:
+        ValueError: for features that are not registered
+    """
+    params = params or {}
+    unknown = set(names) - set(REGISTRY)
+    if unknown:
+        raise ValueError(f"unknown features {sorted(unknown)}, registered: {sorted(REGISTRY)}")
+    return [c for name in names if not future_only or REGISTRY[name].future
+            for c in REGISTRY[name].columns(params.get(name, {}))]
+
+
+def _compute(name: str, params: dict, grid: pl.DataFrame) -> pl.DataFrame:
+    """feature name for every (unique_id, ds) of grid, from cache where possible"""
+    key = (name, json.dumps(params, sort_keys=True, default=str))
+    feature = REGISTRY[name]
+    cached = _CACHE.get(key)
+    todo = grid if cached is None else grid.join(cached, on=["unique_id", "ds"], how="anti")
+    if not todo.is_empty():
+        computed = feature.apply(
+            todo.lazy(), {**params, "start": todo["ds"].min(), "end": todo["ds"].max()}
+        ).select("unique_id", "ds", *feature.columns(params)).collect()
+        cached = computed if cached is None else pl.concat([cached, computed])
+        _CACHE[key] = cached
+    return cached # type: ignore
+
+
+def clear_cache() -> None:
+    """drops all memoized feature values"""
+    _CACHE.clear()
+
+
+def build(df: pl.DataFrame, h: int, names: Iterable[str], params: dict | None = None
+          ) -> tuple[pl.DataFrame, pl.DataFrame | None]:
+    """adds the features to df and builds the futr_df of the h days after every series
+
+    Args:
+        df (pl.DataFrame): data in nixtla format
+        h (int): forecast horizon (days)
+        names (Iterable[str]): registered features to add, nothing is computed for others
+        params (dict | None): feature name -> its params
+
+    Returns:
+        tuple[pl.DataFrame, pl.DataFrame | None]: df with features, futr_df with the future
+        features (None if no future feature was requested)
+    """
+    names, params = list(names), params or {}
+    columns(names, params) # validates the names
+    if not names:
+        return df, None
+
+    last = df.group_by("unique_id").agg(pl.col("ds").max())
+    future_grid = (
+        last.with_columns(pl.date_ranges(pl.col("ds") + timedelta(1),
+                                         pl.col("ds") + timedelta(h)).alias("ds"))
+        .explode("ds")
+    )
+    grid = pl.concat([df.select("unique_id", "ds"), future_grid.select("unique_id", "ds")])
+
+    history, future = df, future_grid.select("unique_id", "ds")
+    for name in names:
+        values = _compute(name, params.get(name, {}), grid)
+        history = history.join(values, on=["unique_id", "ds"], how="left", maintain_order="left")
+        if REGISTRY[name].future:
+            future = future.join(values, on=["unique_id", "ds"], how="left",
+                                 maintain_order="left")
+
+    has_future = any(REGISTRY[name].future for name in names)
+    return history, future.sort(["unique_id", "ds"]) if has_future else None
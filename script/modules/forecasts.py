@@ -0,0 +1,219 @@
+"""Append-only, versioned store of the forecasts of every run
+
+Layout of a forecast store directory:
+
+    manifest.parquet                                   one row per written file
+    run_date=2026-01-02/origin=2025-12-27/<run>_<kind>.parquet   tidy forecasts
+
+Every run adds new files and never changes old ones, so all forecast vintages are
+kept. The manifest knows run, origin, kind, date range and series range of every file,
+so lookups (latest forecast of a series, all vintages of an origin) only read the files
+they need, and within a file the rows are sorted by series so the parquet statistics
+skip the row groups of other series.
+"""
+
+import json
+import os
+from datetime import date, datetime
+from typing import Iterable
+import polars as pl
+
+MANIFEST_FILE = "manifest.parquet"
+_KEYS = ("unique_id", "ds")
+_ROW_GROUP = 16_384 # small row groups, so a series lookup reads little of a file
+
+
+def _manifest_path(store_dir: str) -> str:
+    """path of the manifest of a forecast store"""
+    return os.path.join(store_dir, MANIFEST_FILE)
+
+
+def manifest(store_dir: str) -> pl.DataFrame:
+    """all files of the store, newest run last
+
+    Returns:
+        pl.DataFrame: run, run_date, origin, kind, models, file, rows, series, first_id,
+        last_id, ds_min, ds_max, meta (empty if nothing was written yet)
+    """
+    path = _manifest_path(store_dir)
+    if not os.path.exists(path):
+        return pl.DataFrame(schema={
+            "run": pl.String, "run_date": pl.Date, "origin": pl.Date, "kind": pl.String,
+            "models": pl.List(pl.String), "file": pl.String, "rows": pl.Int64,
+            "series": pl.Int64, "first_id": pl.String, "last_id": pl.String,
+            "ds_min": pl.Date, "ds_max": pl.Date, "meta": pl.String,
+        })
+    return pl.read_parquet(path)
+
+
+def _tidy(predictions: pl.DataFrame) -> pl.DataFrame:
+    """unique_id, ds, model, y_hat from the wide layout of the models (a column per model)"""
+    models = [c for c in predictions.columns if c not in (*_KEYS, "y")]
+    return (
+        predictions.unpivot(on=models, index=list(_KEYS), variable_name="model",
+                            value_name="y_hat")
+        .with_columns(pl.col("unique_id").cast(pl.String), pl.col("y_hat").cast(pl.Float64))
+        .sort("unique_id", "model", "ds")
+    )
+
+
+def write(store_dir: str, predictions: pl.DataFrame, origin: str | date, kind: str = "forecast",
+          run: str | None = None, meta: dict | None = None) -> str:
+    """adds the forecasts of one run to the store
+
+    Args:
+        store_dir (str): the store directory, created if missing
+        predictions (pl.DataFrame): unique_id, ds and a column per model, a y column
+        (e.g. of test predictions) is left out, actuals are joined by ``versus_actual``
+        origin (str | date): the last day of data the forecast is based on
+        kind (str): e.g. "forecast" or "test", runs can write several kinds
+        run (str | None): the run id, a timestamp if None
+        meta (dict | None): kept as json in the manifest, e.g. why a fallback was published
+
+    Returns:
+        str: the run id, to write the other kinds of the same run under
+    """
+    now = datetime.now()
+    run = run or now.strftime("%Y%m%dT%H%M%S")
+    origin = date.fromisoformat(origin) if isinstance(origin, str) else origin
+    tidy = _tidy(predictions)
+
+    part_dir = os.path.join(store_dir, f"run_date={now.date()}", f"origin={origin}")
+    os.makedirs(part_dir, exist_ok=True)
+    path, i = os.path.join(part_dir, f"{run}_{kind}.parquet"), 0
+    while os.path.exists(path): # same run and kind written twice, e.g. a rerun within a second
+        i += 1
+        path = os.path.join(part_dir, f"{run}_{kind}_{i}.parquet")
+    tidy.write_parquet(path, row_group_size=_ROW_GROUP, statistics=True)
+
+    entry = pl.DataFrame({
+        "run": [run], "run_date": [now.date()], "origin": [origin], "kind": [kind],
+        "models": [tidy["model"].unique().sort().to_list()],
+        "file": [os.path.relpath(path, store_dir)], "rows": [tidy.height],
+        "series": [tidy["unique_id"].n_unique()],
+        "first_id": [tidy["unique_id"].min()], "last_id": [tidy["unique_id"].max()],
+        "ds_min": [tidy["ds"].min()], "ds_max": [tidy["ds"].max()],
+        "meta": [json.dumps(meta or {}, default=str)],
+    })
+    # write next to the manifest and swap, so a failure never leaves half a manifest
+    tmp = _manifest_path(store_dir) + ".tmp"
+    pl.concat([manifest(store_dir), entry], how="diagonal_relaxed").write_parquet(tmp)
+    os.replace(tmp, _manifest_path(store_dir))
+    return run
+
+
+def _scan(store_dir: str, files: pl.DataFrame, ids: Iterable[str] | None,
+          models: Iterable[str] | None) -> pl.LazyFrame:
+    """the forecasts of the manifest rows files, limited to ids and models"""
+    if ids is not None:
+        ids = sorted(ids)
+        if ids: # only files whose series range can contain one of the ids
+            files = files.filter((pl.col("first_id") <= ids[-1]) & (pl.col("last_id") >= ids[0]))
+    if files.is_empty():
+        return pl.LazyFrame(schema={"unique_id": pl.String, "ds": pl.Date, "model": pl.String,
+                                    "y_hat": pl.Float64, "run": pl.String, "origin": pl.Date,
+                                    "kind": pl.String})
+    lf = pl.concat([
+        pl.scan_parquet(os.path.join(store_dir, row["file"])).with_columns(
+            pl.lit(row["run"]).alias("run"), pl.lit(row["origin"]).alias("origin"),
+            pl.lit(row["kind"]).alias("kind"))
+        for row in files.iter_rows(named=True)
+    ])
+    if ids is not None:
+        lf = lf.filter(pl.col("unique_id").is_in(list(ids)))
+    if models is not None:
+        lf = lf.filter(pl.col("model").is_in(list(models)))
+    return lf
+
+
+def latest(store_dir: str, ids: Iterable[str] | None = None, kind: str = "forecast",
+           models: Iterable[str] | None = None, lazy: bool = False
+           ) -> pl.DataFrame | pl.LazyFrame:
+    """the newest forecast of the series
+
+    Only the files of the newest run (whose series range can contain the ids) are read.
+    Without ids that is the whole newest run. With ids, the ids the newest run did not
+    write are looked up in the older runs, newest first, until every id is found.
+
+    Args:
+        store_dir (str): the store directory
+        ids (Iterable[str] | None): series to fetch, those of the newest run if None
+        kind (str): the kind the runs wrote
+        models (Iterable[str] | None): models to fetch, all if None
+        lazy (bool): return a LazyFrame of the result
+
+    Returns:
+        pl.DataFrame | pl.LazyFrame: unique_id, ds, model, y_hat, run, origin, kind
+    """
+    files = manifest(store_dir).filter(pl.col("kind") == kind)
+    runs = files["run"].unique().sort(descending=True).to_list()
+    missing = None if ids is None else set(ids)
+    parts = [_scan(store_dir, files.clear(), None, models).collect()] # the empty schema
+    for run in runs:
+        if missing is not None and not missing:
+            break
+        part = _scan(store_dir, files.filter(pl.col("run") == run), missing,
+                     models).collect(engine="streaming")
+        parts.append(part)
+        if missing is None: # all series of the newest run
+            break
+        missing -= set(part["unique_id"].unique())
+    df = pl.concat(parts).sort("unique_id", "model", "ds")
+    return df.lazy() if lazy else df
+
+
+def vintages(store_dir: str, origin: str | date, ids: Iterable[str] | None = None,
+             kind: str = "forecast", models: Iterable[str] | None = None, lazy: bool = False
+             ) -> pl.DataFrame | pl.LazyFrame:
+    """every forecast made from one origin, e.g. to see how reruns changed it
+
+    Returns:
+        pl.DataFrame | pl.LazyFrame: unique_id, ds, model, y_hat, run, origin, kind
+    """
+    origin = date.fromisoformat(origin) if isinstance(origin, str) else origin
+    files = manifest(store_dir).filter((pl.col("origin") == origin) & (pl.col("kind") == kind))
+    lf = _scan(store_dir, files, ids, models).sort("run", "unique_id", "model", "ds")
+    return lf if lazy else lf.collect(engine="streaming")
+
+
+def versus_actual(store_dir: str, actuals: pl.DataFrame | pl.LazyFrame,
+                  ids: Iterable[str] | None = None, kind: str = "forecast",
+                  models: Iterable[str] | None = None, lazy: bool = False
+                  ) -> pl.DataFrame | pl.LazyFrame:
+    """all stored forecasts next to the actuals that are known by now
+
+    Only files whose date range overlaps the actuals are read.
+
+    Args:
+        actuals (pl.DataFrame | pl.LazyFrame): unique_id, ds, y e.g. from ``store.load``
+
+    Returns:
+        pl.DataFrame | pl.LazyFrame: unique_id, ds, model, y_hat, run, origin, kind, y,
+        horizon (days after the origin)
+    """
+    actuals = actuals.lazy().select(pl.col("unique_id").cast(pl.String), "ds", "y")
+    last = actuals.select(pl.col("ds").max()).collect().item()
+    files = manifest(store_dir).filter((pl.col("kind") == kind) & (pl.col("ds_min") <= last))
+    lf = (
+        _scan(store_dir, files, ids, models)
+        .join(actuals, on=list(_KEYS), how="inner")
+        .with_columns((pl.col("ds") - pl.col("origin")).dt.total_days().alias("horizon"))
+        .sort("unique_id", "model", "run", "ds")
+    )
+    return lf if lazy else lf.collect(engine="streaming")
+
+
+def export_csv(store_dir: str, path: str, run: str | None = None, kind: str = "forecast"
+               ) -> None:
+    """writes one run (the newest if None) in the wide layout of the models as csv"""
+    files = manifest(store_dir).filter(pl.col("kind") == kind)
+    if files.is_empty():
+        raise ValueError(f"no '{kind}' forecasts in {store_dir}")
+    run = run or files["run"].max()
+    (
+        _scan(store_dir, files.filter(pl.col("run") == run), None, None)
+        .collect()
+        .pivot(on="model", index=list(_KEYS), values="y_hat")
+        .sort(*_KEYS)
+        .write_csv(path)
+    )
@@ -0,0 +1,121 @@
+"""Vectorized holiday calendar features for one or many countries/regions
+
+A locale is a country code with an optional subdivision, e.g. "US", "AT" or "AT-4".
+The distance to the next and previous holiday is found with sorted as-of joins, so a
+calendar costs O(days + holidays) instead of comparing every day with every holiday.
+Calendars are built for whole years and can be cached on disk as parquet.
+"""
+
+import os
+from datetime import date
+import holidays
+import polars as pl
+
+NO_HOLIDAY_DAYS = 365 # distance used if there is no holiday before/after a date
+
+
+def _parse_locale(locale: str) -> tuple[str, str | None]:
+    """splits "AT-4" into ("AT", "4"), "US" into ("US", None)"""
+    country, _, subdiv = locale.partition("-")
+    return country, subdiv or None
+
+
+def _holiday_table(locale: str, years: range) -> pl.DataFrame:
+    """sorted table of the holiday dates and names of a locale"""
+    country, subdiv = _parse_locale(locale)
+    calendar = holidays.country_holidays(country, subdiv=subdiv, years=years)
+    return pl.DataFrame(
+        {"holiday": list(calendar.keys()), "holiday_name": list(calendar.values())},
+        schema={"holiday": pl.Date, "holiday_name": pl.String},
+    ).sort("holiday")
+
+
+def _build_calendar(locale: str, start_year: int, end_year: int) -> pl.DataFrame:
+    """daily holiday features of a locale for whole years, inclusive"""
+    # one extra year each side, so the distances at the edges see the neighbouring holidays
+    table = _holiday_table(locale, range(start_year - 1, end_year + 2))
+    days = pl.DataFrame({"ds": pl.date_range(date(start_year, 1, 1), date(end_year, 12, 31),
+                                             interval="1d", eager=True)})
+
+    dates = table.select("holiday")
+    return (
+        days
+        .join_asof(dates.rename({"holiday": "next"}), left_on="ds", right_on="next",
+                   strategy="forward", allow_exact_matches=False)
+        .join_asof(dates.rename({"holiday": "last"}), left_on="ds", right_on="last",
+                   strategy="backward", allow_exact_matches=False)
+        .join(table, left_on="ds", right_on="holiday", how="left", maintain_order="left")
+        .with_columns(
+            pl.col("holiday_name").is_not_null().alias("is_holiday"),
+            pl.col("holiday_name").fill_null(""),
+            (pl.col("next") - pl.col("ds")).dt.total_days()
+                .fill_null(NO_HOLIDAY_DAYS).alias("days_to_holiday"),
+            (pl.col("ds") - pl.col("last")).dt.total_days()
+                .fill_null(NO_HOLIDAY_DAYS).alias("days_since_holiday"),
+        )
+        .with_columns(pl.col("is_holiday").cast(pl.Int64).alias("num_holidays"))
+        .select("ds", "is_holiday", "holiday_name", "days_to_holiday",
+                "days_since_holiday", "num_holidays")
+        .sort("ds")
+    )
+
+
+def holiday_calendar(locale: str = "US", start_date: str = "2020-07-01",
+                     end_date: str = "2026-01-31", cache_dir: str | None = None
+                     ) -> pl.DataFrame:
+    """daily holiday features of one locale
+
+    Args:
+        locale (str): country code with optional subdivision, e.g. "US" or "AT-4"
+        start_date (str): first day, inclusive
+        end_date (str): last day, inclusive
+        cache_dir (str | None): directory for the cached calendars, None to not cache
+
+    Returns:
+        pl.DataFrame: ds, is_holiday, holiday_name, days_to_holiday, days_since_holiday,
+        num_holidays
+    """
+    start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    path = None
+    if cache_dir:
+        path = os.path.join(cache_dir, f"holidays_{locale}_{start.year}_{end.year}.parquet")
+    if path and os.path.exists(path):
+        calendar = pl.read_parquet(path)
+    else:
+        calendar = _build_calendar(locale, start.year, end.year)
+        if path:
+            os.makedirs(cache_dir, exist_ok=True) # type: ignore
+            calendar.write_parquet(path)
+    return calendar.filter(pl.col("ds").is_between(start, end))
+
+
+def add_holiday_features(df: pl.DataFrame, locales: dict[str, str] | None = None,
+                         default_locale: str = "US", cache_dir: str | None = None
+                         ) -> pl.DataFrame:
+    """joins the holiday features of the locale of every series onto a long df
+
+    Args:
+        df (pl.DataFrame): long format with unique_id and ds, e.g. a future df
+        locales (dict[str, str] | None): unique_id -> locale, missing series use the default
+        default_locale (str): locale of all series not in locales
+        cache_dir (str | None): see ``holiday_calendar``
+
+    Returns:
+        pl.DataFrame: df with the holiday feature columns, same row order
+    """
+    start, end = str(df["ds"].min()), str(df["ds"].max())
+    series_locale = (
+        df.select(pl.col("unique_id").unique())
+        .with_columns(pl.col("unique_id").cast(pl.String) # e.g. Enum ids of compact data
+                      .replace_strict(locales or {}, default=default_locale,
+                                      return_dtype=pl.String).alias("locale"))
+    )
+    calendars = pl.concat([
+        holiday_calendar(locale, start, end, cache_dir).with_columns(pl.lit(locale).alias("locale"))
+        for locale in series_locale["locale"].unique().sort()
+    ])
+    return (
+        df.join(series_locale, on="unique_id", how="left", maintain_order="left")
+        .join(calendars, on=["locale", "ds"], how="left", maintain_order="left")
+        .drop("locale")
+    )
@@ -0,0 +1,189 @@
+"""Graph-compiled NHITS inference without NeuralForecast and Lightning
+
+``export`` traces the network of a trained NHITS into a TorchScript (or ONNX) file,
+``CompiledPredictor`` runs it on cpu: the last input_size days of every series are
+cut from the polars frame, scaled with the robust local scaler of NeuralForecast
+(median and median absolute deviation of the whole series), predicted in fixed size
+batches and scaled back. Only univariate models (no exogenous features) and the
+identity model scaler are supported, i.e. the configuration of FinalModel.
+"""
+
+import json
+import os
+from datetime import timedelta
+import numpy as np
+import polars as pl
+
+FORMATS = ("torchscript", "onnx")
+META_FILE = "compiled.json"
+
+
+def _network(model):
+    """the traceable network of a NeuralForecast model: (insample_y, mask) -> forecast"""
+    import torch # pylint: disable=import-outside-toplevel
+
+    class Network(torch.nn.Module):
+        """NHITS forward on plain tensors, without exogenous features"""
+        def __init__(self, model) -> None:
+            super().__init__()
+            self.model = model
+
+        def forward(self, insample_y, insample_mask):
+            empty = insample_y.new_zeros(0)
+            out = self.model({"insample_y": insample_y.unsqueeze(-1),
+                              "insample_mask": insample_mask.unsqueeze(-1),
+                              "futr_exog": empty, "hist_exog": empty, "stat_exog": empty})
+            return out.reshape(out.shape[0], out.shape[1], -1)[..., 0]
+
+    return Network(model)
+
+
+def export(nf, out_dir: str, fmt: str = "torchscript", batch_size: int = 1024,
+           artifact: str | None = None) -> str:
+    """writes the network of a fitted NeuralForecast NHITS and its settings to out_dir
+
+    Args:
+        nf: fitted NeuralForecast object with one model, e.g. FinalModel.model
+        out_dir (str): directory of the compiled model, created if missing
+        fmt (str): one of FORMATS, onnx needs onnxruntime to predict
+        batch_size (int): series per call of the network, batches are padded to it
+        artifact (str | None): key of the exported artifact, kept as the model version
+
+    Returns:
+        str: path of the network file
+    """
+    import torch # pylint: disable=import-outside-toplevel
+    if fmt not in FORMATS:
+        raise ValueError(f"fmt must be one of {FORMATS}, got '{fmt}'")
+    model = nf.models[0]
+    if model.futr_exog_list or model.hist_exog_list or model.stat_exog_list:
+        raise ValueError("only models without exogenous features can be compiled")
+    if model.hparams.get("scaler_type", "identity") != "identity":
+        raise ValueError("only models with scaler_type='identity' can be compiled")
+    if nf.local_scaler_type not in (None, "robust"):
+        raise ValueError(f"local_scaler_type must be robust or None, got {nf.local_scaler_type}")
+
+    os.makedirs(out_dir, exist_ok=True)
+    network = _network(model).cpu().float().eval()
+    example = (torch.zeros(batch_size, model.input_size), torch.ones(batch_size, model.input_size))
+    path = os.path.join(out_dir, "nhits.pt" if fmt == "torchscript" else "nhits.onnx")
+    with torch.no_grad():
+        if fmt == "torchscript":
+            torch.jit.freeze(torch.jit.trace(network, example, check_trace=False)).save(path)
+        else:
+            torch.onnx.export(network, example, path, input_names=["insample_y", "mask"],
+                              output_names=["forecast"], dynamo=False)
+    with open(os.path.join(out_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"format": fmt, "file": os.path.basename(path), "batch_size": batch_size,
+                   "input_size": model.input_size, "h": model.h,
+                   "alias": model.alias or type(model).__name__,
+                   "local_scaler": nf.local_scaler_type, "artifact": artifact}, f, indent=2)
+    return path
+
+
+def windows(df: pl.DataFrame, input_size: int, robust: bool = True
+            ) -> tuple[pl.DataFrame, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """the scaled input windows of every series, left padded like NeuralForecast does
+
+    Returns:
+        tuple: unique_id with the last ds per series, insample_y and mask (series x
+        input_size, float32), offset and scale per series
+    """
+    y = pl.col("y").cast(pl.Float64)
+    stats = (
+        df.sort("unique_id", "ds")
+        .group_by("unique_id", maintain_order=True)
+        .agg(pl.col("ds").last().alias("last_ds"), y.tail(input_size).alias("window"),
+             y.median().alias("offset"), (y - y.median()).abs().median().alias("scale"))
+    )
+    if not robust:
+        stats = stats.with_columns(pl.lit(0.0).alias("offset"), pl.lit(1.0).alias("scale"))
+    offset = stats["offset"].fill_null(0).to_numpy()
+    scale = stats["scale"].fill_null(1).to_numpy()
+    scale = np.where(scale == 0, 1.0, scale) # constant series are only shifted
+
+    lengths = stats["window"].list.len().to_numpy()
+    values = stats["window"].explode().fill_null(0).to_numpy()
+    rows = np.repeat(np.arange(stats.height), lengths)
+    position = np.arange(len(values)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    cols = input_size - np.repeat(lengths, lengths) + position # right aligned windows
+    insample_y = np.zeros((stats.height, input_size), dtype=np.float32)
+    mask = np.zeros((stats.height, input_size), dtype=np.float32)
+    insample_y[rows, cols] = (values - offset[rows]) / scale[rows]
+    mask[rows, cols] = 1.0
+    return stats.select("unique_id", "last_ds"), insample_y, mask, offset, scale
+
+
+class CompiledPredictor():
+    """runs an exported NHITS on cpu, a drop-in for ``NeuralForecast.predict(df=...)``"""
+    def __init__(self, out_dir: str, threads: int = 0) -> None:
+        with open(os.path.join(out_dir, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.h = self.meta["h"]
+        self.alias = self.meta["alias"]
+        path = os.path.join(out_dir, self.meta["file"])
+        if self.meta["format"] == "torchscript":
+            import torch # pylint: disable=import-outside-toplevel
+            if threads:
+                torch.set_num_threads(threads)
+            self._network = torch.jit.load(path, map_location="cpu")
+            self._run = self._run_torchscript
+        else:
+            import onnxruntime # pylint: disable=import-outside-toplevel
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = threads
+            self._network = onnxruntime.InferenceSession(path, options)
+            self._run = self._run_onnx
+
+    def _run_torchscript(self, insample_y: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        import torch # pylint: disable=import-outside-toplevel
+        with torch.inference_mode():
+            return self._network(torch.from_numpy(insample_y), torch.from_numpy(mask)).numpy()
+
+    def _run_onnx(self, insample_y: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        return self._network.run(None, {"insample_y": insample_y, "mask": mask})[0]
+
+    def predict(self, df: pl.DataFrame) -> pl.DataFrame:
+        """h days after the history of every series of df in nixtla format
+
+        Args:
+            df (pl.DataFrame): unique_id, ds, y, at least the input window of each series
+
+        Returns:
+            pl.DataFrame: unique_id, ds and the forecast in a column named like the model
+        """
+        batch_size = self.meta["batch_size"]
+        keys, insample_y, mask, offset, scale = windows(
+            df, self.meta["input_size"], self.meta["local_scaler"] == "robust")
+        n = len(insample_y)
+        padded = -n % batch_size # the network was traced with a fixed batch size
+        insample_y = np.concatenate([insample_y, np.zeros((padded, insample_y.shape[1]),
+                                                          dtype=np.float32)])
+        mask = np.concatenate([mask, np.zeros((padded, mask.shape[1]), dtype=np.float32)])
+        forecast = np.concatenate([
+            self._run(insample_y[i:i+batch_size], mask[i:i+batch_size])
+            for i in range(0, len(insample_y), batch_size)
+        ])[:n] * scale[:, None] + offset[:, None]
+
+        return (
+            keys.with_columns(pl.date_ranges(pl.col("last_ds") + timedelta(1),
+                                             pl.col("last_ds") + timedelta(self.h)).alias("ds"))
+            .explode("ds")
+            .select("unique_id", "ds")
+            .with_columns(pl.Series(self.alias, forecast.astype(np.float32).ravel()))
+        )
+
+
+def max_deviation(nf, predictor: CompiledPredictor, df: pl.DataFrame) -> float:
+    """largest absolute difference of the compiled forecast to ``nf.predict(df=df)``,
+    relative to the scale of the series, to check an export"""
+    alias = predictor.alias
+    expected = nf.predict(df=df).select("unique_id", "ds", pl.col(alias).alias("expected"))
+    scale = df.group_by("unique_id").agg(pl.col("y").abs().mean().clip(1e-8).alias("scale"))
+    return (
+        predictor.predict(df)
+        .join(expected, on=["unique_id", "ds"])
+        .join(scale, on="unique_id")
+        .select(((pl.col(alias) - pl.col("expected")).abs() / pl.col("scale")).max())
+        .item()
+    )
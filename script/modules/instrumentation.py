@@ -0,0 +1,189 @@
+"""Lightweight per-stage instrumentation and the json run report
+
+Functions decorated with ``@timed("name")`` (or blocks in ``with stage("name"):``)
+record wall time, cpu time, peak RSS and the rows/series of the frame they return
+into the active run report. Without an active report they only call through.
+One chosen stage can be profiled with cProfile or py-spy.
+"""
+
+import cProfile
+import functools
+import json
+import os
+import resource
+import signal
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Iterator
+import polars as pl
+
+PROFILERS = ("cprofile", "py-spy")
+
+
+def rss() -> int:
+    """current resident memory of the process in bytes"""
+    try:
+        with open("/proc/self/statm", encoding="utf-8") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError: # no procfs, fall back to the (monotonic) peak of the process
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakRSS:
+    """samples the RSS from a thread while active, so native allocations are included"""
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.start = self.peak = 0
+        self._running = False
+        self._thread: threading.Thread | None = None
+
+    def __enter__(self) -> "PeakRSS":
+        self.start = self.peak = rss()
+        self._running = True
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._running = False
+        self._thread.join() # type: ignore
+        self.peak = max(self.peak, rss())
+
+    def _sample(self) -> None:
+        while self._running:
+            self.peak = max(self.peak, rss())
+            time.sleep(self.interval)
+
+    @property
+    def above_start(self) -> int:
+        """peak bytes above the RSS at the start"""
+        return self.peak - self.start
+
+
+class RunReport:
+    """collects the stages of one run"""
+    def __init__(self, profile_stage: str | None = None, profiler: str = "cprofile",
+                 profile_dir: str = ".") -> None:
+        if profiler not in PROFILERS:
+            raise ValueError(f"profiler must be one of {PROFILERS}, got '{profiler}'")
+        self.profile_stage = profile_stage
+        self.profiler = profiler
+        self.profile_dir = profile_dir
+        self.started = datetime.now()
+        self.start = time.perf_counter()
+        self.stages: list[dict] = []
+        self._open: list[dict] = []
+
+    def annotate(self, **values) -> None:
+        """adds values (e.g. steps_per_second) to the innermost running stage"""
+        if self._open:
+            self._open[-1].update(values)
+
+    def to_dict(self) -> dict:
+        """the report as json-able dict"""
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "wall_seconds": time.perf_counter() - self.start,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10,
+            "stages": self.stages,
+        }
+
+    def save(self, path: str) -> None:
+        """writes the report as json"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+
+
+_REPORT: RunReport | None = None
+
+
+def start_run(profile_stage: str | None = None, profiler: str = "cprofile",
+              profile_dir: str = ".") -> RunReport:
+    """activates a new run report, all instrumented stages record into it"""
+    global _REPORT # pylint: disable=global-statement
+    _REPORT = RunReport(profile_stage, profiler, profile_dir)
+    return _REPORT
+
+
+def annotate(**values) -> None:
+    """adds values to the running stage of the active report, if there is one"""
+    if _REPORT is not None:
+        _REPORT.annotate(**values)
+
+
+def _frame_counts(result) -> dict:
+    """rows and series of the (first) eager frame a stage returned"""
+    if isinstance(result, tuple) and result:
+        result = result[0]
+    if isinstance(result, pl.DataFrame):
+        counts = {"rows": result.height}
+        if "unique_id" in result.columns:
+            counts["series"] = result["unique_id"].n_unique()
+        return counts
+    return {}
+
+
+@contextmanager
+def _profiled(report: RunReport, name: str) -> Iterator[None]:
+    """profiles the block if it is the chosen stage"""
+    if report.profile_stage != name:
+        yield
+        return
+    os.makedirs(report.profile_dir, exist_ok=True)
+    if report.profiler == "cprofile":
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(os.path.join(report.profile_dir, f"{name}.prof"))
+    else:
+        spy = subprocess.Popen(["py-spy", "record", "--pid", str(os.getpid()), "--output",
+                                os.path.join(report.profile_dir, f"{name}.svg")])
+        try:
+            yield
+        finally:
+            spy.send_signal(signal.SIGINT) # py-spy writes the flamegraph on interrupt
+            spy.wait()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[dict]:
+    """records one stage into the active report, yields its record for extra values"""
+    report = _REPORT
+    if report is None:
+        yield {}
+        return
+    running = report._open # pylint: disable=protected-access
+    record: dict = {"stage": name, "parent": running[-1]["stage"] if running else None}
+    running.append(record)
+    memory = PeakRSS()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        with memory, _profiled(report, name):
+            yield record
+    finally:
+        record["wall_seconds"] = time.perf_counter() - wall
+        record["cpu_seconds"] = time.process_time() - cpu
+        record["peak_rss_mb"] = memory.above_start / 2**20
+        running.pop()
+        report.stages.append(record)
+
+
+def timed(name: str) -> Callable:
+    """decorator that records every call of the function as stage name"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name) as record:
+                result = func(*args, **kwargs)
+                # e.g. fit returns nothing, then the counts of the input frame are recorded
+                record.update(_frame_counts(result) or next(
+                    (_frame_counts(a) for a in args if isinstance(a, pl.DataFrame)), {}))
+            return result
+        return wrapper
+    return decorator
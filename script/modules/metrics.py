@@ -0,0 +1,118 @@
+"""Forecast metrics as one lazy polars group by
+
+All metrics of all model columns are aggregations of one group by over the series
+(and e.g. backtest windows), so truth and predictions are joined and scored in a single
+lazy pass without materialising the joined frame.
+"""
+
+from typing import Iterable
+import polars as pl
+
+from .outliers import Frame
+
+METRICS = ("mae", "mape", "rmse", "smape", "mase", "direction")
+_SEP = "__" # metric__model in the wide intermediate result
+
+
+def _metric_expr(metric: str, model: str, target: str = "y") -> pl.Expr:
+    """aggregation of one metric of one model column within a group"""
+    y, pred = pl.col(target), pl.col(model)
+    error = (y - pred).abs()
+    if metric == "mae":
+        expr = error.mean()
+    elif metric == "mape": # days without views are left out instead of dividing by 0
+        expr = (error / pl.when(y != 0).then(y.abs())).mean()
+    elif metric == "rmse":
+        expr = ((y - pred)**2).mean().sqrt()
+    elif metric == "smape":
+        expr = (error / (y.abs() + pred.abs())).fill_nan(0).mean()
+    elif metric == "mase": # scale: in-sample seasonal naive mae, joined from the training data
+        expr = error.mean() / pl.col("_mase_scale").first()
+    elif metric == "direction": # 1 if the change over the horizon has the right sign
+        expr = ((y.sort_by("ds").last() - y.sort_by("ds").first()).sign()
+                == (pred.sort_by("ds").last() - pred.sort_by("ds").first()).sign()
+                ).cast(pl.Float64)
+    else:
+        raise ValueError(f"metric must be one of {METRICS}, got '{metric}'")
+    return expr.alias(f"{metric}{_SEP}{model}")
+
+
+def _mase_scale(train: Frame, season_length: int, id_col: str, target: str) -> pl.LazyFrame:
+    """mean absolute seasonal difference of every series in the training data"""
+    return (
+        train.lazy().sort(id_col, "ds")
+        .group_by(id_col)
+        .agg((pl.col(target) - pl.col(target).shift(season_length)).abs().mean()
+             .alias("_mase_scale"))
+    )
+
+
+def evaluate(predictions: Frame, truth: Frame | None = None,
+             models: Iterable[str] | None = None,
+             metrics: Iterable[str] = ("mae", "mape", "rmse"), by: Iterable[str] = (),
+             train: Frame | None = None, season_length: int = 7, id_col: str = "unique_id",
+             target: str = "y") -> pl.LazyFrame:
+    """scores every model column per series (and the by columns) in one lazy pass
+
+    Args:
+        predictions (Frame): id_col, ds, the by columns and one column per model
+        truth (Frame | None): id_col, ds, target; None if target is already in predictions
+        models (Iterable[str] | None): model columns, all other columns if None
+        metrics (Iterable[str]): any of METRICS
+        by (Iterable[str]): further group columns, e.g. ("window",), for tidy predictions
+        like the backtest output ("model", "window") with models=["y_hat"]
+        train (Frame | None): training data, needed for "mase"
+        season_length (int): season of the naive forecast that scales "mase"
+        id_col (str): the series id column
+        target (str): the true value column
+
+    Returns:
+        pl.LazyFrame: tidy id_col, *by, metric, model, value
+    """
+    metrics, by = list(metrics), list(by)
+    lf = predictions.lazy()
+    if truth is not None:
+        truth = truth.lazy().select(id_col, "ds", target)
+        if lf.collect_schema()[id_col] != truth.collect_schema()[id_col]:
+            # e.g. Enum ids of compact data, the model output may carry plain strings
+            lf = lf.with_columns(pl.col(id_col).cast(pl.String))
+            truth = truth.with_columns(pl.col(id_col).cast(pl.String))
+        lf = lf.join(truth, on=[id_col, "ds"], how="inner")
+    if models is None:
+        models = [c for c in lf.collect_schema().names()
+                  if c not in (id_col, "ds", target, *by)]
+    if "mase" in metrics:
+        if train is None:
+            raise ValueError("the mase metric needs the training data")
+        lf = lf.join(_mase_scale(train, season_length, id_col, target), on=id_col, how="left")
+
+    scores = (
+        lf.group_by(id_col, *by)
+        .agg(_metric_expr(metric, model, target) for metric in metrics for model in models)
+        .unpivot(index=[id_col, *by], variable_name="name")
+        .with_columns(pl.col("name").str.split_exact(_SEP, 1)
+                      .struct.rename_fields(["metric", "_model"]).alias("parts"))
+        .unnest("parts")
+    )
+    if "model" in by: # the model is already a group column
+        return scores.select(id_col, *by, "metric", "value")
+    return scores.select(id_col, *by, "metric", pl.col("_model").alias("model"), "value")
+
+
+def summarize(scores: Frame, by: Iterable[str] = ()) -> pl.LazyFrame:
+    """averages per series scores over all series, keeping the by columns"""
+    by = [c for c in by if c not in ("metric", "model")] # always group columns
+    return (
+        scores.lazy()
+        .group_by(*by, "metric", "model")
+        .agg(pl.col("value").mean(), pl.len().alias("series"))
+        .sort(*by, "metric", "model")
+    )
+
+
+def to_wide(scores: Frame, id_col: str = "unique_id") -> pl.DataFrame:
+    """the layout of utilsforecast.evaluate: one row per series and metric, a column per model"""
+    if isinstance(scores, pl.LazyFrame):
+        scores = scores.collect()
+    index = [c for c in scores.columns if c not in ("model", "value")]
+    return scores.pivot(on="model", index=index, values="value").sort(id_col, "metric")
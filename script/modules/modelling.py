@@ -1,22 +1,111 @@
-""""Contains the configured final Model as well as a baseline model"""
+""""Contains the configured final Model as well as a baseline model
 
-import polars as pl
+The baseline lives in baseline.py so it can be used without importing torch, it is
+re-exported here.
+"""
 
-from statsforecast import StatsForecast
-from statsforecast.models import SeasonalNaive
+import os
+import sys
+import time
+import polars as pl
+import torch
+from pytorch_lightning import Callback
 
 from neuralforecast import NeuralForecast
 from neuralforecast.models import NHITS
 from neuralforecast.losses.pytorch import HuberLoss
 
-from utilsforecast.evaluation import evaluate
-from utilsforecast.losses import mae, mape, rmse
+from . import artifacts, instrumentation, metrics
+from .baseline import BaseLineModel # pylint: disable=unused-import
+from .instrumentation import timed
+
+def configure_device(device: str = "auto", threads: int = 0, interop_threads: int = 0,
+                     num_workers: int = 0, bf16: bool = False) -> dict:
+    """picks the accelerator and sets up torch for it
+
+    Args:
+        device (str): "auto" for gpu if one exists else cpu, "gpu" or "cpu"
+        threads (int): intra-op threads on cpu, 0 for one per core
+        interop_threads (int): inter-op threads on cpu, 0 keeps the torch default
+        num_workers (int): dataloader workers
+        bf16 (bool): use bfloat16 autocast if the device supports it
+
+    Returns:
+        dict: trainer kwargs for the neuralforecast models
+    """
+    if device == "auto":
+        device = "gpu" if torch.cuda.is_available() else "cpu"
+
+    if device == "cpu":
+        torch.set_num_threads(threads or os.cpu_count() or 1)
+        if interop_threads:
+            try:
+                torch.set_num_interop_threads(interop_threads)
+            except RuntimeError: # can only be set once, before any parallel work
+                pass
+        bf16 = bf16 and torch.backends.mkldnn.is_available()
+    else:
+        bf16 = bf16 and torch.cuda.is_bf16_supported()
+
+    settings = {
+        "accelerator": device,
+        "devices": 1,
+        "precision": "bf16-mixed" if bf16 else "32-true",
+        "dataloader_kwargs": {"num_workers": num_workers,
+                              "persistent_workers": num_workers > 0},
+    }
+    print(f"Device: {device}, precision: {settings['precision']}, "
+          f"threads: {torch.get_num_threads()}, "
+          f"interop threads: {torch.get_num_interop_threads()}, dataloader workers: {num_workers}")
+    return settings
+
+
+class StepsPerSecond(Callback):
+    """measures the training throughput, to size the nodes"""
+    def __init__(self) -> None:
+        self.start = 0.
+        self.steps_per_second = 0.
+
+    def on_train_start(self, trainer, pl_module) -> None:
+        self.start = time.perf_counter()
+
+    def on_train_end(self, trainer, pl_module) -> None:
+        seconds = time.perf_counter() - self.start
+        self.steps_per_second = trainer.global_step / seconds if seconds else 0.
+        print(f"Trained {trainer.global_step} steps in {seconds:.1f}s, "
+              f"{self.steps_per_second:.2f} steps/s")
+        instrumentation.annotate(steps=trainer.global_step,
+                                 steps_per_second=self.steps_per_second)
+
 
 class FinalModel():
-    """the final tuned version of our model"""
-    def __init__(self, h) -> None:
+    """the final tuned version of our model
+
+    With an artifact_dir trained models are reused if hyperparameters, code and data
+    are unchanged, with fine_tune_steps > 0 a model of the same configuration trained on
+    fewer days is fine-tuned on the new data instead of training from zero.
+
+    With early_stopping the first fit holds out the last val_size days (h if 0) and stops
+    once the validation loss did not improve for patience checks. The step with the
+    lowest validation loss is kept in converged_steps and every later fit (the refit on
+    all data) trains for exactly that many steps without holding out data.
+
+    params overrides the tuned hyperparameters, callbacks are extra lightning callbacks.
+    """
+    def __init__(self, h, device: str = "auto", threads: int = 0, interop_threads: int = 0,
+                 num_workers: int = 0, bf16: bool = False, artifact_dir: str | None = None,
+                 fine_tune_steps: int = 0, early_stopping: bool = False, val_size: int = 0,
+                 patience: int = 3, val_check_steps: int = 50, params: dict | None = None,
+                 callbacks: list | None = None) -> None:
         ins = h*18
         ms = 1200
+        self.throughput = StepsPerSecond()
+        self.artifact_dir = artifact_dir
+        self.fine_tune_steps = fine_tune_steps
+        self.early_stopping = early_stopping
+        self.val_size = val_size or h
+        self.converged_steps: int | None = None
+        self.runtime = configure_device(device, threads, interop_threads, num_workers, bf16)
 
         nbeats_params = {
             "h": h,
@@ -26,51 +115,108 @@ class FinalModel():
             "enable_model_summary": False,
             "enable_checkpointing": False,
             "logger": False,
-            "accelerator": "gpu",
-            "devices": 1,
+            **self.runtime,
             "batch_size": 128,
             "learning_rate": 1589e-7,
             "mlp_units": [[256, 256]]*2,
             'n_pool_kernel_size': (16, 8, 1),
             'n_freq_downsample': (168, 24, 1),
         }
-        self.model  = NeuralForecast(
-            models = [NHITS  (**nbeats_params)], #type: ignore
-            freq = "1d",
-            local_scaler_type="robust"
+        nbeats_params.update(params or {}) # e.g. the result of tune.py
+        self.callbacks = [self.throughput, *(callbacks or [])]
+        nbeats_params["callbacks"] = list(self.callbacks)
+        if early_stopping:
+            nbeats_params["early_stop_patience_steps"] = patience
+            nbeats_params["val_check_steps"] = val_check_steps
+        self.params = nbeats_params
+        self.model = self._new_model(nbeats_params["max_steps"], early_stopping)
+        self.family = artifacts.family_key(
+            {**nbeats_params, "freq": "1d", "local_scaler_type": "robust"}, sys.modules[__name__]
         )
 
+    @timed("FinalModel.fit")
     def fit(self, df: pl.DataFrame)-> None:
-        """fit the baseline model on data in nixtla format"""
-        self.model.fit(df) #type: ignore
+        """fit the final model on data in nixtla format, reusing stored artifacts if possible"""
+        refit = self.early_stopping and self.converged_steps is not None
+        val_size = self.val_size if self.early_stopping and not refit else 0
+        # the refit trains a new model for the converged steps, not the loaded or last one
+        max_steps = self.converged_steps if refit else self.params["max_steps"]
 
-    def predict(self, future_features: pl.DataFrame|None) -> pl.DataFrame:
-        """make predictions horizon h in days, outputs in nixtla format"""
-        return self.model.predict(futr_df= future_features) #type: ignore
+        if self.artifact_dir is None:
+            self._train(df, val_size, max_steps) # type: ignore
+            return
 
-    def get_metrics(self, true: pl.DataFrame, predictions: pl.DataFrame) -> pl.DataFrame:
-        """evalutes the model on true data, both must be nixtla format"""
-        return evaluate(
-            true.join(predictions, on=["unique_id", "ds"]),
-            metrics=[mae, mape, rmse], # List the metrics you want
+        data = {**artifacts.data_summary(df), "val_size": val_size, "max_steps": max_steps}
+        key = artifacts.artifact_key(self.family, data)
+        cached = artifacts.load(self.artifact_dir, key)
+        if cached is not None:
+            print(f"Loaded model {key} trained on data until {data['end']}")
+            self.model = self._with_runtime(cached)
+            if val_size:
+                self.converged_steps = artifacts.read_meta(self.artifact_dir, key
+                                                           )["converged_steps"]
+            return
+
+        base = None
+        if self.fine_tune_steps:
+            base = artifacts.latest_for_warm_start(self.artifact_dir, self.family, data)
+        if base is not None:
+            print(f"Fine-tuning model {base} for {self.fine_tune_steps} steps")
+            self.model = self._with_runtime(artifacts.load(self.artifact_dir, base),
+                                            self.fine_tune_steps) #type: ignore
+            self.model.fit(df, use_init_models=False) #type: ignore
+        else:
+            self._train(df, val_size, max_steps) # type: ignore
+        artifacts.save(self.model, self.artifact_dir, key, self.family,
+                       {**data, "converged_steps": self.converged_steps})
+
+    def _new_model(self, max_steps: int, early_stopping: bool) -> NeuralForecast:
+        """an untrained model of the configured params with a step budget"""
+        params = {**self.params, "max_steps": max_steps, "callbacks": list(self.callbacks)}
+        if not early_stopping:
+            params["early_stop_patience_steps"] = -1
+        return NeuralForecast(
+            models = [NHITS  (**params)], #type: ignore
+            freq = "1d",
+            local_scaler_type="robust"
         )
 
-class BaseLineModel():
-    """Seasonal naive model with season length of 7 default"""
-    def __init__(self, season_length: int = 7) -> None:
-        self.model = StatsForecast(models=[SeasonalNaive(season_length)], freq='1d')
+    def _train(self, df: pl.DataFrame, val_size: int, max_steps: int) -> None:
+        """trains a new model from zero, records the best validation step if val_size > 0"""
+        self.model = self._new_model(max_steps, early_stopping=val_size > 0)
+        self.model.fit(df, val_size=val_size) #type: ignore
+        trajectory = self.model.models[0].valid_trajectories
+        if val_size and trajectory:
+            self.converged_steps = int(min(trajectory, key=lambda t: t[1])[0])
+            print(f"Validation loss converged at step {self.converged_steps}")
 
-    def fit(self, df: pl.DataFrame)-> None:
-        """fit the baseline model on data in nixtla format"""
-        self.model.fit(df) #type: ignore
+    def _with_runtime(self, model: NeuralForecast, max_steps: int | None = None
+                      ) -> NeuralForecast:
+        """puts the current device settings (and step budget) on a loaded model, without
+        early stop"""
+        trainer = {k: v for k, v in self.runtime.items() if k != "dataloader_kwargs"}
+        for m in model.models:
+            # dataloader_kwargs belong to the model, the lightning Trainer rejects them
+            m.trainer_kwargs.update(trainer, callbacks=list(self.callbacks))
+            m.dataloader_kwargs = self.runtime["dataloader_kwargs"]
+            if max_steps is not None: # e.g. the converged steps of the early stopped fit
+                m.max_steps = max_steps
+                m.trainer_kwargs["max_steps"] = max_steps
+            m.early_stop_patience_steps = -1 # the fixed step budget replaces early stopping
+        return model
+
+    @timed("FinalModel.predict")
+    def predict(self, future_features: pl.DataFrame|None, df: pl.DataFrame|None = None
+                ) -> pl.DataFrame:
+        """make predictions horizon h in days, outputs in nixtla format
 
-    def predict(self, h: int, future_features: pl.DataFrame|None) -> pl.DataFrame:
-        """make predictions horizon h in days, outputs in nixtla format"""
-        return self.model.predict(h, future_features) #type: ignore
+        df is the history to predict from, the training data if None
+        """
+        return self.model.predict(df=df, futr_df= future_features) #type: ignore
 
     def get_metrics(self, true: pl.DataFrame, predictions: pl.DataFrame) -> pl.DataFrame:
         """evalutes the model on true data, both must be nixtla format"""
-        return evaluate(
-            true.join(predictions, on=["unique_id", "ds"]),
-            metrics=[mae, mape, rmse], # List the metrics you want
-        )
+        return metrics.to_wide(metrics.evaluate(
+            predictions, true,
+            metrics=["mae", "mape", "rmse"], # List the metrics you want
+        ))
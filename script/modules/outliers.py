@@ -0,0 +1,148 @@
+"""Vectorized per-series outlier capping
+
+All bounds are computed for every series in one grouped pass, either as
+window expressions (``cap_outliers``) or as a small per-series bounds table
+(``outlier_bounds``) that can be joined back onto new data (``apply_bounds``).
+Everything works the same on eager and lazy frames.
+"""
+
+from typing import Iterable, Tuple, TypeVar
+import polars as pl
+
+Frame = TypeVar("Frame", pl.DataFrame, pl.LazyFrame)
+
+METHODS = ("iqr", "percentile", "zscore", "hampel")
+STATIC_METHODS = ("iqr", "percentile", "zscore") # bounds are one value per series
+
+_MAD_TO_STD = 1.4826 # scales the MAD to the std of a normal distribution
+# the params every method takes, so one config can hold the params of several methods
+METHOD_PARAMS = {
+    "iqr": ("factor",),
+    "percentile": ("lower", "upper"),
+    "zscore": ("threshold",),
+    "hampel": ("window", "threshold"),
+}
+
+
+def method_params(method: str, params: dict) -> dict:
+    """the params of method, those of the other methods are ignored
+
+    Raises:
+        ValueError: for an unknown method or a param no method takes (e.g. a typo)
+    """
+    if method not in METHOD_PARAMS:
+        raise ValueError(f"method must be one of {METHODS}, got '{method}'")
+    known = {name for names in METHOD_PARAMS.values() for name in names}
+    unknown = set(params) - known
+    if unknown:
+        raise ValueError(f"unknown outlier params {sorted(unknown)}, known are {sorted(known)}")
+    return {k: v for k, v in params.items() if k in METHOD_PARAMS[method]}
+
+
+def _bound_exprs(method: str, column: str = "y", factor: float = 1.5, lower: float = 1,
+                 upper: float = 99, threshold: float = 3) -> Tuple[pl.Expr, pl.Expr]:
+    """lower and upper bound aggregations of one series for the static methods
+
+    Args:
+        method (str): one of "iqr", "percentile", "zscore"
+        column (str): column the bounds are computed on
+        factor (float): IQR multiplier
+        lower (float): lower percentile (0-100)
+        upper (float): upper percentile (0-100)
+        threshold (float): number of standard deviations for the z-score
+
+    Returns:
+        Tuple[pl.Expr, pl.Expr]: lower bound, upper bound
+    """
+    col = pl.col(column)
+    if method == "iqr":
+        q1, q3 = col.quantile(0.25), col.quantile(0.75)
+        return q1 - factor * (q3 - q1), q3 + factor * (q3 - q1)
+    if method == "percentile":
+        return col.quantile(lower/100), col.quantile(upper/100)
+    if method == "zscore":
+        return col.mean() - threshold * col.std(), col.mean() + threshold * col.std()
+    raise ValueError(f"method must be one of {STATIC_METHODS}, got '{method}'")
+
+
+def _hampel_exprs(column: str = "y", window: int = 7, threshold: float = 3
+                  ) -> Tuple[pl.Expr, pl.Expr]:
+    """rolling median +- threshold * scaled MAD, centered window of 2*window+1 days"""
+    size = 2*window + 1
+    median = pl.col(column).rolling_median(size, center=True, min_samples=1)
+    mad = (pl.col(column) - median).abs().rolling_median(size, center=True, min_samples=1)
+    return median - threshold * _MAD_TO_STD * mad, median + threshold * _MAD_TO_STD * mad
+
+
+def outlier_bounds(df: Frame, method: str = "iqr", column: str = "y",
+                   group_by: str = "unique_id", **params) -> Frame:
+    """computes the capping bounds of every series in one group by
+
+    Args:
+        df (Frame): long format data, eager or lazy
+        method (str): one of "iqr", "percentile", "zscore"
+        column (str): the value column
+        group_by (str): the series id column
+        **params: factor, lower, upper, threshold see ``_bound_exprs``, only those of
+        the method are used (see METHOD_PARAMS)
+
+    Returns:
+        Frame: one row per series with columns group_by, "lower", "upper"
+    """
+    if method not in STATIC_METHODS:
+        raise ValueError(f"method must be one of {STATIC_METHODS}, got '{method}'")
+    low, high = _bound_exprs(method, column, **method_params(method, params))
+    return df.group_by(group_by).agg(low.alias("lower"), high.alias("upper"))
+
+
+def apply_bounds(df: Frame, bounds: Frame, column: str = "y", group_by: str = "unique_id",
+                 exclude: Iterable[str] = ()) -> Frame:
+    """clips the values of df with precomputed per series bounds via a join
+
+    Series without bounds and those in exclude are left untouched.
+    """
+    capped = (
+        df.join(bounds.select(group_by, "lower", "upper"), on=group_by, how="left")
+        .with_columns(_clip(column, pl.col("lower"), pl.col("upper"), group_by, exclude))
+        .drop("lower", "upper")
+    )
+    return capped
+
+
+def cap_outliers(df: Frame, method: str = "iqr", column: str = "y", group_by: str = "unique_id",
+                 exclude: Iterable[str] = (), order_by: str = "ds", **params) -> Frame:
+    """caps outliers of every series separately in a single window pass
+
+    Args:
+        df (Frame): long format data, eager or lazy
+        method (str): one of "iqr", "percentile", "zscore", "hampel"
+        column (str): the value column to cap
+        group_by (str): the series id column
+        exclude (Iterable[str]): series that are kept as they are, i.e. new trends
+        order_by (str): time column, only needed for the rolling "hampel" method
+        **params: factor, lower, upper, threshold and window (hampel only), only those of
+        the method are used (see METHOD_PARAMS)
+
+    Returns:
+        Frame: df with the capped column as float
+    """
+    params = method_params(method, params)
+    if method == "hampel":
+        low, high = _hampel_exprs(column, **params)
+        low, high = low.over(group_by, order_by=order_by), high.over(group_by, order_by=order_by)
+    else:
+        low, high = _bound_exprs(method, column, **params)
+        low, high = low.over(group_by), high.over(group_by)
+
+    return df.with_columns(_clip(column, low, high, group_by, exclude))
+
+
+def _clip(column: str, low: pl.Expr, high: pl.Expr, group_by: str,
+          exclude: Iterable[str]) -> pl.Expr:
+    """clip expression that keeps the values of excluded or unbounded series"""
+    values = pl.col(column).cast(pl.Float64)
+    clipped = pl.when(low.is_null() | high.is_null()).then(values).otherwise(values.clip(low, high))
+    exclude = list(exclude)
+    if exclude:
+        clipped = pl.when(pl.col(group_by).is_in(exclude)).then(values).otherwise(clipped)
+    return clipped.alias(column)
@@ -0,0 +1,122 @@
+"""Batched, cached forecasting for the local forecast server
+
+Concurrent requests are queued and answered together: the batcher waits a few
+milliseconds for more requests, predicts all series that are not cached yet in one
+``predict`` call and then answers every request from the cache. The cache is keyed
+by (model version, series, origin), the origin being the last day of the history.
+"""
+
+import queue
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable
+import polars as pl
+
+
+@dataclass
+class Forecaster:
+    """a loaded model that always predicts h days for the requested series
+
+    predict gets a list of unique_ids and returns unique_id, ds, y_hat for them.
+    """
+    version: str
+    origin: str
+    h: int
+    predict: Callable[[list[str]], pl.DataFrame]
+    series: set[str] = field(default_factory=set)
+
+
+def final_forecaster(model, history: pl.DataFrame, version: str) -> Forecaster:
+    """wraps a fitted NeuralForecast object, history must contain the input window"""
+    def predict(ids: list[str]) -> pl.DataFrame:
+        pred = model.predict(df=history.filter(pl.col("unique_id").is_in(ids)))
+        return pred.rename({model.models[0].alias or type(model.models[0]).__name__: "y_hat"})
+
+    return Forecaster(version, str(history["ds"].max()), model.h, predict,
+                      set(history["unique_id"].unique()))
+
+
+def compiled_forecaster(predictor, history: pl.DataFrame, version: str) -> Forecaster:
+    """wraps an inference.CompiledPredictor, the exported final model without lightning"""
+    def predict(ids: list[str]) -> pl.DataFrame:
+        pred = predictor.predict(history.filter(pl.col("unique_id").is_in(ids)))
+        return pred.rename({predictor.alias: "y_hat"})
+
+    return Forecaster(version, str(history["ds"].max()), predictor.h, predict,
+                      set(history["unique_id"].unique()))
+
+
+def baseline_forecaster(model, history: pl.DataFrame, h: int, version: str) -> Forecaster:
+    """wraps a fitted BaseLineModel, it predicts all series at once and is filtered after"""
+    def predict(ids: list[str]) -> pl.DataFrame:
+        pred = model.predict(h, None).filter(pl.col("unique_id").is_in(ids))
+        return pred.select("unique_id", "ds", pl.col("SeasonalNaive").alias("y_hat"))
+
+    return Forecaster(version, str(history["ds"].max()), h, predict,
+                      set(history["unique_id"].unique()))
+
+
+class Batcher:
+    """answers forecast requests of one forecaster in batches from a cache"""
+    def __init__(self, forecaster: Forecaster, max_wait: float = 0.01) -> None:
+        self.forecaster = forecaster
+        self.max_wait = max_wait
+        self.cache: dict[tuple[str, str, str], pl.DataFrame] = {}
+        self.requests: queue.Queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, ids: list[str], h: int) -> Future:
+        """queues a request, the future resolves to unique_id, ds, y_hat
+
+        Raises:
+            ValueError: for unknown series or a horizon longer than the model's
+        """
+        unknown = set(ids) - self.forecaster.series
+        if unknown:
+            raise ValueError(f"unknown unique_id(s): {sorted(unknown)}")
+        if not 0 < h <= self.forecaster.h:
+            raise ValueError(f"h must be between 1 and {self.forecaster.h}, got {h}")
+        future: Future = Future()
+        self.requests.put((ids, h, future))
+        return future
+
+    def _key(self, unique_id: str) -> tuple[str, str, str]:
+        return self.forecaster.version, unique_id, self.forecaster.origin
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.requests.get()]
+            try: # collect everything that arrives within max_wait
+                while True:
+                    batch.append(self.requests.get(timeout=self.max_wait))
+            except queue.Empty:
+                pass
+            self._answer(batch)
+
+    def _answer(self, batch: list[tuple[list[str], int, Future]]) -> None:
+        """one predict call for all uncached series of the batch, then answer from cache
+
+        Every request gets its own result or error, a failing request never stops the
+        thread that answers the others.
+        """
+        missing = sorted({i for ids, _, _ in batch for i in ids if self._key(i) not in self.cache})
+        try:
+            if missing:
+                pred = self.forecaster.predict(missing).sort(["unique_id", "ds"])
+                for (unique_id,), part in pred.group_by("unique_id"):
+                    self.cache[self._key(unique_id)] = part # type: ignore
+        except Exception as e: # pylint: disable=broad-exception-caught
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        for ids, h, future in batch:
+            try:
+                unanswered = [i for i in ids if self._key(i) not in self.cache]
+                if unanswered: # the model returned no forecast for them
+                    raise KeyError(f"no forecast for unique_id(s): {unanswered}")
+                future.set_result(pl.concat([self.cache[self._key(i)].head(h) for i in ids]))
+            except Exception as e: # pylint: disable=broad-exception-caught
+                future.set_exception(e)
@@ -0,0 +1,181 @@
+"""Sharded training of the final model for panels too large for one training loop
+
+The series are split into shards, by a hash of the id or by their profile (scale and
+weekly seasonality, so similar series share a model). Every shard gets its own
+FinalModel, trained in a worker process and saved under shard_dir, so time and memory
+of one training grow with the shard instead of the panel. The router sends every
+series of a predict call to the model of its shard and merges the outputs into the
+usual unique_id, ds, NHITS frame.
+"""
+
+import multiprocessing
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+import polars as pl
+
+from . import metrics
+from .instrumentation import timed
+
+STRATEGIES = ("hash", "profile")
+ASSIGNMENT_FILE = "assignment.parquet"
+
+
+def assign_shards(df: pl.DataFrame, n_shards: int, strategy: str = "hash",
+                  season_length: int = 7) -> pl.DataFrame:
+    """the shard of every series
+
+    Args:
+        df (pl.DataFrame): data in nixtla format
+        n_shards (int): number of shards
+        strategy (str): "hash" (crc32 of the id, the same for a series in every run and
+        polars version, independent of the others) or
+        "profile" (equally sized groups of series with similar scale and seasonality)
+        season_length (int): the season the profile measures
+
+    Returns:
+        pl.DataFrame: unique_id, shard
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"strategy must be one of {STRATEGIES}, got '{strategy}'")
+    if strategy == "hash":
+        return _hash_shards(df.select(pl.col("unique_id").unique()), n_shards)
+    # seasonality: share of the variance explained by the mean of the day in the season
+    season = (pl.int_range(pl.len()) % season_length).over("unique_id")
+    profile = (
+        df.sort("unique_id", "ds")
+        .with_columns(pl.col("y").mean().over("unique_id", season).alias("_season_mean"))
+        .group_by("unique_id")
+        .agg(pl.col("y").mean().log1p().alias("scale"),
+             (pl.col("_season_mean").var() / pl.col("y").var()).fill_nan(0).fill_null(0)
+             .alias("seasonality"))
+    )
+    return (
+        profile.sort("scale", "seasonality", "unique_id")
+        .with_columns((pl.int_range(pl.len()) * n_shards // pl.len()).cast(pl.Int32)
+                      .alias("shard"))
+        .select("unique_id", "shard")
+    )
+
+
+def _hash_shards(ids: pl.DataFrame, n_shards: int) -> pl.DataFrame:
+    """unique_id, shard by the crc32 of the id, unlike Expr.hash stable across versions"""
+    return ids.with_columns(pl.col("unique_id").cast(pl.String).map_batches(
+        lambda s: pl.Series([zlib.crc32(i.encode()) % n_shards for i in s], dtype=pl.Int32),
+        return_dtype=pl.Int32).alias("shard"))
+
+
+def _fit_shard(h: int, model_kwargs: dict, df: pl.DataFrame, path: str,
+               converged_steps: int | None) -> tuple[str, int | None]:
+    """trains the model of one shard and saves it, runs in a worker process"""
+    from .modelling import FinalModel # pylint: disable=import-outside-toplevel
+    model = FinalModel(h, **model_kwargs)
+    model.converged_steps = converged_steps # set by an earlier fit with early stopping
+    model.fit(df)
+    model.model.save(path, overwrite=True, save_dataset=True)
+    return path, model.converged_steps
+
+
+class ShardedModel():
+    """the final model trained per shard of series, with the interface of FinalModel
+
+    model_kwargs are passed on to every FinalModel, e.g. threads to split the cpus
+    between the processes.
+    """
+    def __init__(self, h: int, n_shards: int = 4, strategy: str = "hash",
+                 processes: int = 1, shard_dir: str = "data/models/shards/",
+                 **model_kwargs) -> None:
+        self.h = h
+        self.n_shards = n_shards
+        self.strategy = strategy
+        self.processes = processes
+        self.shard_dir = shard_dir
+        self.model_kwargs = model_kwargs
+        self.assignment: pl.DataFrame | None = None
+        self.converged_steps: dict[int, int | None] = {}
+        self._models: dict[int, object] = {}
+
+    @timed("ShardedModel.fit")
+    def fit(self, df: pl.DataFrame) -> None:
+        """trains one model per shard, in parallel if processes > 1
+
+        A refit keeps the shards of the series it already knows, so the converged steps
+        of a shard still belong to the same series, new series go to the shard of their
+        hash.
+        """
+        if self.assignment is None:
+            self.assignment = assign_shards(df, self.n_shards, self.strategy)
+        else:
+            known = self.assignment.join(df.select(pl.col("unique_id").unique()),
+                                         on="unique_id", how="semi")
+            new = df.select(pl.col("unique_id").unique()).join(self.assignment, on="unique_id",
+                                                               how="anti")
+            self.assignment = pl.concat([known, _hash_shards(new, self.n_shards)
+                                         .cast(known.schema)])
+        os.makedirs(self.shard_dir, exist_ok=True)
+        self.assignment.write_parquet(os.path.join(self.shard_dir, ASSIGNMENT_FILE))
+        shards = df.join(self.assignment, on="unique_id").partition_by(
+            "shard", as_dict=True, include_key=False)
+        tasks = [(self.h, self.model_kwargs, part,
+                  os.path.join(self.shard_dir, f"shard={shard}"),
+                  self.converged_steps.get(shard))
+                 for (shard,), part in sorted(shards.items())]
+
+        if self.processes <= 1:
+            results = [_fit_shard(*task) for task in tasks]
+        else: # spawn, forking a process that already uses polars/torch threads can deadlock
+            with ProcessPoolExecutor(self.processes,
+                                     mp_context=multiprocessing.get_context("spawn")) as pool:
+                results = list(pool.map(_fit_shard, *zip(*tasks)))
+
+        self._models = {} # drop the models of the previous fit
+        for (shard,), (_, converged) in zip(sorted(shards), results):
+            self.converged_steps[shard] = converged
+        print(f"Trained {len(results)} shard models on {df['unique_id'].n_unique()} series")
+
+    def _model(self, shard: int):
+        """the trained model of a shard, loaded once"""
+        if shard not in self._models:
+            from neuralforecast import NeuralForecast # pylint: disable=import-outside-toplevel
+            self._models[shard] = NeuralForecast.load(
+                os.path.join(self.shard_dir, f"shard={shard}"))
+        return self._models[shard]
+
+    @timed("ShardedModel.predict")
+    def predict(self, future_features: pl.DataFrame|None, df: pl.DataFrame|None = None
+                ) -> pl.DataFrame:
+        """routes the series to their shard models, outputs in nixtla format
+
+        df is the history to predict from (only its series are predicted), the training
+        data if None
+        """
+        if self.assignment is None:
+            self.assignment = pl.read_parquet(os.path.join(self.shard_dir, ASSIGNMENT_FILE))
+        assignment = self.assignment
+        if df is not None:
+            requested = df.select(pl.col("unique_id").unique())
+            unknown = requested.join(assignment, on="unique_id", how="anti")
+            if not unknown.is_empty() and self.strategy != "hash":
+                raise ValueError(f"{unknown.height} series were not in the training data and "
+                                 f"have no shard: {sorted(unknown['unique_id'].cast(pl.String))}")
+            assignment = pl.concat([ # new series go to the shard of their hash
+                assignment.join(requested, on="unique_id", how="semi"),
+                _hash_shards(unknown, self.n_shards).cast(assignment.schema),
+            ])
+
+        preds = []
+        for shard in assignment["shard"].unique().sort():
+            ids = assignment.filter(pl.col("shard") == shard).select("unique_id")
+            preds.append(self._model(shard).predict( # type: ignore
+                df=None if df is None else df.join(ids, on="unique_id", how="semi"),
+                futr_df=None if future_features is None
+                else future_features.join(ids, on="unique_id", how="semi"),
+            ))
+        return pl.concat(preds).sort("unique_id", "ds")
+
+    def get_metrics(self, true: pl.DataFrame, predictions: pl.DataFrame) -> pl.DataFrame:
+        """evalutes the model on true data, both must be nixtla format"""
+        return metrics.to_wide(metrics.evaluate(
+            predictions, true,
+            metrics=["mae", "mape", "rmse"],
+        ))
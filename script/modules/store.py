@@ -0,0 +1,216 @@
+"""Append-only, month partitioned parquet store for the processed pageviews
+
+Layout of a store directory:
+
+    state.parquet                           per series outlier bounds and bookkeeping
+    month=2025-12/2025-12-01_2025-12-27.parquet   capped data, one file per appended delta
+
+New days are capped with the stored bounds and written as a new file, so a daily
+refresh only touches the delta. The whole history is only read again when the state
+is stale, i.e. the bounds are too old, the outlier settings changed or a new series
+showed up.
+"""
+
+import json
+import os
+import shutil
+from datetime import timedelta
+from typing import Iterable
+import polars as pl
+
+from . import outliers
+
+STATE_FILE = "state.parquet"
+PARTITION = "month"
+
+
+def _state_path(store_dir: str) -> str:
+    """path of the state file of a store"""
+    return os.path.join(store_dir, STATE_FILE)
+
+
+def read_state(store_dir: str) -> pl.DataFrame | None:
+    """per series state of the store or None if the store was never built
+
+    Returns:
+        pl.DataFrame | None: unique_id, lower, upper, last_ds, bounds_ds, method, params,
+        exclude
+    """
+    _recover(store_dir)
+    path = _state_path(store_dir)
+    return pl.read_parquet(path) if os.path.exists(path) else None
+
+
+def is_stale(state: pl.DataFrame | None, delta: pl.DataFrame, method: str, params: dict,
+             max_age: int = 30, exclude: Iterable[str] = ()) -> bool:
+    """whether the bounds have to be recomputed on the full history
+
+    Args:
+        state (pl.DataFrame | None): see ``read_state``
+        delta (pl.DataFrame): the new rows in long format
+        method (str): the configured outlier method
+        params (dict): the configured outlier parameters
+        max_age (int): days of new data after which the bounds are recomputed
+        exclude (Iterable[str]): the configured uncapped series, the capped history
+        changes with them
+
+    Returns:
+        bool: True if a full recompute is needed
+    """
+    if state is None or state.is_empty():
+        return True
+    if state["method"][0] != method or state["params"][0] != json.dumps(params, sort_keys=True):
+        return True
+    if "exclude" not in state.columns or state["exclude"][0] != json.dumps(sorted(exclude)):
+        return True # stores built before exclude was recorded are rebuilt once
+    if not delta["unique_id"].is_in(state["unique_id"]).all():
+        return True # a new series has no bounds yet
+    return delta["ds"].max() - state["bounds_ds"].min() > timedelta(max_age) # type: ignore
+
+
+def load(store_dir: str, end_date: None|str = None, lazy: bool = False,
+         compact_dtypes: bool = False) -> outliers.Frame:
+    """reads the processed data of the store in the format of ``dataprocessing.preprocess``
+
+    Args:
+        store_dir (str): the store directory
+        end_date (None|str): None for all data, datestring to limit the data, inclusive
+        lazy (bool): return a LazyFrame instead of reading the data
+        compact_dtypes (bool): Enum ids (from the state) and Float32 values, see
+        ``dataprocessing.compact``
+
+    Returns:
+        outliers.Frame: long format data with ds, unique_id, y sorted by unique_id, ds
+    """
+    _recover(store_dir)
+    df = pl.scan_parquet(os.path.join(store_dir, f"{PARTITION}=*", "*.parquet"),
+                         hive_partitioning=True).drop(PARTITION, "y_raw")
+    if end_date:
+        df = df.filter(pl.col("ds") <= pl.lit(end_date).str.to_date())
+    if compact_dtypes:
+        ids = sorted(read_state(store_dir)["unique_id"].cast(pl.String)) # type: ignore
+        df = df.with_columns(pl.col("unique_id").cast(pl.Enum(ids)), pl.col("y").cast(pl.Float32))
+    df = df.sort(["unique_id", "ds"])
+    return df if lazy else df.collect(engine="streaming")
+
+
+def append(store_dir: str, delta: pl.DataFrame, method: str = "iqr",
+           exclude: Iterable[str] = (), max_age: int = 30, **params) -> bool:
+    """adds new days to the store, recomputing everything only if the state is stale
+
+    Rows that are already in the store (by series and date) are ignored, so the same
+    export can be appended twice.
+
+    Args:
+        store_dir (str): the store directory, created if missing
+        delta (pl.DataFrame): new rows in long format (ds, unique_id, y) e.g. from ingest
+        method (str): one of outliers.STATIC_METHODS
+        exclude (Iterable[str]): series that are not capped
+        max_age (int): days of new data after which the bounds are recomputed
+        **params: the outlier parameters, e.g. factor=1.5
+
+    Returns:
+        bool: True if the store was fully recomputed, False if only the delta was written
+    """
+    if method not in outliers.STATIC_METHODS:
+        raise ValueError(f"incremental capping needs one of {outliers.STATIC_METHODS}, "
+                         f"got '{method}'")
+    exclude = list(exclude)
+    state = read_state(store_dir)
+    if state is not None:
+        delta = (
+            delta.join(state.select("unique_id", "last_ds"), on="unique_id", how="left")
+            .filter(pl.col("last_ds").is_null() | (pl.col("ds") > pl.col("last_ds")))
+            .drop("last_ds")
+        )
+    if delta.is_empty():
+        return False
+
+    delta = delta.select("ds", "unique_id", pl.col("y").cast(pl.Float64).alias("y_raw"))
+    if is_stale(state, delta, method, params, max_age, exclude):
+        _rebuild(store_dir, delta, state is not None, method, exclude, params)
+        return True
+
+    capped = outliers.apply_bounds(delta.with_columns(pl.col("y_raw").alias("y")),
+                                   state, exclude=exclude) # type: ignore
+    _write_partitions(store_dir, capped)
+    last = delta.group_by("unique_id").agg(pl.col("ds").max().alias("new_last_ds"))
+    state = (
+        state.join(last, on="unique_id", how="left") # type: ignore
+        .with_columns(pl.coalesce("new_last_ds", "last_ds").alias("last_ds"))
+        .drop("new_last_ds")
+    )
+    state.write_parquet(_state_path(store_dir))
+    return False
+
+
+def _rebuild(store_dir: str, delta: pl.DataFrame, has_history: bool, method: str,
+             exclude: Iterable[str], params: dict) -> None:
+    """recomputes the bounds on history + delta and rewrites the whole store"""
+    raw = delta
+    if has_history:
+        history = (
+            pl.scan_parquet(os.path.join(store_dir, f"{PARTITION}=*", "*.parquet"),
+                            hive_partitioning=True)
+            .select("ds", "unique_id", "y_raw")
+            .collect(engine="streaming")
+        )
+        raw = pl.concat([history, delta])
+
+    bounds = outliers.outlier_bounds(raw, method, "y_raw", **params)
+    capped = outliers.apply_bounds(raw.with_columns(pl.col("y_raw").alias("y")), bounds,
+                                   exclude=exclude)
+
+    # write next to the old store and swap, so a failure never leaves half a store
+    tmp_dir = store_dir.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    _write_partitions(tmp_dir, capped)
+    state = bounds.join(
+        raw.group_by("unique_id").agg(pl.col("ds").max().alias("last_ds")), on="unique_id"
+    ).with_columns(
+        pl.col("last_ds").max().alias("bounds_ds"),
+        pl.lit(method).alias("method"),
+        pl.lit(json.dumps(params, sort_keys=True)).alias("params"),
+        pl.lit(json.dumps(sorted(exclude))).alias("exclude"),
+    )
+    state.write_parquet(_state_path(tmp_dir))
+
+    # two directory renames: the old store is only deleted once the new one is in place,
+    # at any point either store_dir or the old store next to it is complete (see _recover)
+    old_dir = _old_dir(store_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(store_dir):
+        os.replace(store_dir, old_dir)
+    os.replace(tmp_dir, store_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _old_dir(store_dir: str) -> str:
+    """where _rebuild keeps the old store during the swap"""
+    return store_dir.rstrip("/") + ".old"
+
+
+def _recover(store_dir: str) -> None:
+    """finishes or undoes a swap of _rebuild that was interrupted"""
+    old_dir = _old_dir(store_dir)
+    if not os.path.exists(old_dir):
+        return
+    if os.path.exists(store_dir): # the new store is in place, only the old one is left
+        shutil.rmtree(old_dir)
+    else: # interrupted between the renames, the old store is still complete
+        os.replace(old_dir, store_dir)
+
+
+def _write_partitions(store_dir: str, df: pl.DataFrame) -> None:
+    """writes one new file per month touched by df, existing files are never changed"""
+    df = df.with_columns(pl.col("ds").dt.strftime("%Y-%m").alias(PARTITION))
+    for (month,), part in df.group_by(PARTITION):
+        part_dir = os.path.join(store_dir, f"{PARTITION}={month}")
+        os.makedirs(part_dir, exist_ok=True)
+        name = f"{part['ds'].min()}_{part['ds'].max()}"
+        path, i = os.path.join(part_dir, f"{name}.parquet"), 0
+        while os.path.exists(path): # same date range appended for other series
+            i += 1
+            path = os.path.join(part_dir, f"{name}_{i}.parquet")
+        part.drop(PARTITION).sort(["unique_id", "ds"]).write_parquet(path)
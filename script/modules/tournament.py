@@ -0,0 +1,224 @@
+"""Model tournament: many model x feature set candidates on one train/test split
+
+Candidates are declared in tournament.toml. Every family (stats, ml, neural) gets its
+own process pool sized by its worker count and thread budget, e.g. many single
+threaded statistical jobs next to a few heavy neural ones. Predictions are cached per
+candidate under a hash of its spec and the data, so a rerun only trains new or
+changed candidates.
+"""
+
+import hashlib
+import importlib
+import importlib.metadata
+import inspect
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+import polars as pl
+
+from . import features, metrics
+
+FAMILIES = ("stats", "ml", "neural")
+_THREAD_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "POLARS_MAX_THREADS")
+
+
+@dataclass(frozen=True)
+class Candidate:
+    """one model with one feature set
+
+    model is the import path of the model class, e.g. "statsforecast.models.AutoARIMA".
+    """
+    name: str
+    family: str
+    model: str
+    params: dict = field(default_factory=dict)
+    features: list[str] = field(default_factory=list)
+    lags: list[int] = field(default_factory=list) # ml only
+
+    def key(self, data: dict, h: int, feature_params: dict | None = None) -> str:
+        """cache key of the spec, the data summary, the horizon, the feature params and
+        the code version (source of the forecast and feature code, model library version)"""
+        payload = json.dumps({"candidate": asdict(self), "data": data, "h": h,
+                              "feature_params": feature_params or {},
+                              "code": _code_version(self.model)}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def _code_version(model: str) -> dict:
+    """hash of the code a candidate runs and the version of its model library"""
+    source = inspect.getsource(_forecast) + inspect.getsource(features)
+    try:
+        library = importlib.metadata.version(model.split(".")[0])
+    except importlib.metadata.PackageNotFoundError:
+        library = ""
+    return {"source": hashlib.sha256(source.encode()).hexdigest()[:16], "library": library}
+
+
+def _model_class(path: str):
+    module, _, name = path.rpartition(".")
+    return getattr(importlib.import_module(module), name)
+
+
+def _forecast(candidate: Candidate, train: pl.DataFrame, h: int, feature_params: dict
+              ) -> pl.DataFrame:
+    """fits the candidate and returns unique_id, ds, y_hat for the h days after train"""
+    id_dtype = train.schema["unique_id"]
+    train, futr = features.build(train, h, candidate.features, feature_params)
+    model = _model_class(candidate.model)
+
+    if candidate.family == "stats":
+        from statsforecast import StatsForecast # pylint: disable=import-outside-toplevel
+        sf = StatsForecast(models=[model(**candidate.params)], freq="1d")
+        pred = sf.forecast(df=train, h=h, X_df=futr)
+    elif candidate.family == "ml":
+        from mlforecast import MLForecast # pylint: disable=import-outside-toplevel
+        mlf = MLForecast(models={candidate.name: model(**candidate.params)}, freq="1d",
+                         lags=candidate.lags or [7, 14, 28])
+        mlf.fit(train, static_features=[])
+        pred = mlf.predict(h, X_df=futr)
+    else:
+        from neuralforecast import NeuralForecast # pylint: disable=import-outside-toplevel
+        exog = features.columns(candidate.features, feature_params, future_only=True)
+        params = {"futr_exog_list": exog, **candidate.params} if exog else candidate.params
+        nf = NeuralForecast(models=[model(h=h, enable_model_summary=False, logger=False,
+                                          enable_checkpointing=False, accelerator="cpu",
+                                          **params)],
+                            freq="1d", local_scaler_type="robust")
+        nf.fit(train)
+        pred = nf.predict(futr_df=futr)
+
+    if not isinstance(pred, pl.DataFrame):
+        pred = pl.from_pandas(pred.reset_index() if "unique_id" not in pred else pred)
+    value_col = next(c for c in pred.columns if c not in ("unique_id", "ds"))
+    return pred.select(pl.col("unique_id").cast(id_dtype), pl.col("ds").cast(pl.Date),
+                       pl.col(value_col).cast(pl.Float64).alias("y_hat"))
+
+
+def run_candidate(candidate: Candidate, train: pl.DataFrame, h: int, threads: int,
+                  cache_path: str, feature_params: dict) -> pl.DataFrame:
+    """runs one candidate with a thread budget and caches its predictions"""
+    if candidate.family == "neural":
+        import torch # pylint: disable=import-outside-toplevel
+        torch.set_num_threads(threads)
+    start = time.perf_counter()
+    pred = _forecast(candidate, train, h, feature_params).with_columns(
+        pl.lit(candidate.name).alias("candidate"),
+        pl.lit(time.perf_counter() - start).alias("seconds"),
+    )
+    pred.write_parquet(cache_path)
+    return pred
+
+
+def load_candidates(path: str) -> list[Candidate]:
+    """the [[candidate]] entries of a toml file"""
+    import tomllib # pylint: disable=import-outside-toplevel
+    with open(path, "rb") as f:
+        spec = tomllib.load(f)
+    candidates = [Candidate(**c) for c in spec["candidate"]]
+    unknown = {c.family for c in candidates} - set(FAMILIES)
+    if unknown:
+        raise ValueError(f"family must be one of {FAMILIES}, got {sorted(unknown)}")
+    return candidates
+
+
+def run_tournament(candidates: list[Candidate], train: pl.DataFrame, test: pl.DataFrame,
+                   h: int, cache_dir: str, resources: dict, feature_params: dict | None = None
+                   ) -> pl.DataFrame:
+    """runs all uncached candidates in per-family process pools and ranks them
+
+    Args:
+        candidates (list[Candidate]): the candidates
+        train (pl.DataFrame): training data in nixtla format
+        test (pl.DataFrame): the h days after train
+        h (int): forecast horizon (days)
+        cache_dir (str): directory of the cached predictions
+        resources (dict): family -> {"workers": processes, "threads": threads per process}
+        feature_params (dict | None): params of the feature registry
+
+    Returns:
+        pl.DataFrame: leaderboard, one row per candidate sorted by mae
+
+    Raises:
+        RuntimeError: if every candidate failed, with the error of each
+    """
+    feature_params = feature_params or {}
+    os.makedirs(cache_dir, exist_ok=True)
+    data = {"train": str(pl.Series(train.hash_rows(seed=0)).sum()), "rows": train.height}
+    paths = {c.name: os.path.join(cache_dir, f"{c.key(data, h, feature_params)}.parquet")
+             for c in candidates}
+    todo = [c for c in candidates if not os.path.exists(paths[c.name])]
+    print(f"{len(candidates) - len(todo)} candidates cached, training {len(todo)}")
+
+    pools, futures = [], []
+    context = multiprocessing.get_context("spawn")
+    for family in FAMILIES:
+        family_todo = [c for c in todo if c.family == family]
+        if not family_todo:
+            continue
+        budget = resources.get(family, {})
+        threads = budget.get("threads", 1)
+        previous = {var: os.environ.get(var) for var in _THREAD_VARS}
+        os.environ.update({var: str(threads) for var in _THREAD_VARS}) # inherited by workers
+        pool = ProcessPoolExecutor(budget.get("workers", 1), mp_context=context)
+        pools.append(pool)
+        futures += [pool.submit(run_candidate, c, train, h, threads, paths[c.name],
+                                feature_params) for c in family_todo]
+        for var, value in previous.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+    failed = _wait(futures, todo)
+    for pool in pools:
+        pool.shutdown()
+
+    done = [c for c in candidates if c.name not in failed]
+    if not done:
+        raise RuntimeError("every candidate failed: " + "; ".join(
+            f"{name}: {error}" for name, error in failed.items()))
+    predictions = pl.concat([pl.read_parquet(paths[c.name]) for c in done])
+    return leaderboard(predictions, test, done)
+
+
+def _wait(futures: list[Future], todo: list[Candidate]) -> dict[str, str]:
+    """waits for all candidates, failures are reported and left out of the leaderboard
+
+    Returns:
+        dict[str, str]: name -> error of the failed candidates
+    """
+    failed = {}
+    for candidate, future in zip(todo, futures):
+        try:
+            future.result()
+        except Exception as e: # pylint: disable=broad-exception-caught
+            print(f"Candidate {candidate.name} failed: {e!r}")
+            failed[candidate.name] = repr(e)
+    return failed
+
+
+def leaderboard(predictions: pl.DataFrame, test: pl.DataFrame, candidates: list[Candidate]
+                ) -> pl.DataFrame:
+    """mean metrics over the series of every candidate, best mae first"""
+    scores = metrics.summarize(metrics.evaluate(
+        predictions.select("unique_id", "ds", pl.col("candidate").alias("model"), "y_hat"),
+        test, models=["y_hat"], metrics=["mae", "mape", "rmse", "smape", "direction"],
+        by=["model"],
+    )).collect()
+    info = pl.DataFrame({
+        "model": [c.name for c in candidates],
+        "family": [c.family for c in candidates],
+        "features": ["+".join(c.features) or "none" for c in candidates],
+    })
+    seconds = (predictions.group_by(pl.col("candidate").alias("model"))
+               .agg(pl.col("seconds").first()))
+    return (
+        scores.pivot(on="metric", index="model", values="value")
+        .join(info, on="model")
+        .join(seconds, on="model")
+        .rename({"model": "candidate"})
+        .sort("mae")
+    )
@@ -0,0 +1,126 @@
+"""Hyperparameter search for the FinalModel with optuna
+
+The search space is the one of the AutoNHITS cell in model_final.ipynb. The study
+lives in a SQLite database, so several worker processes can share it and an
+interrupted search continues where it stopped. Trials report their validation loss
+at every validation check and are pruned if they fall behind (median or hyperband).
+"""
+
+import json
+import os
+import optuna
+from pytorch_lightning import Callback
+import polars as pl
+
+from .modelling import FinalModel
+
+# categorical choices are stored by name, optuna only persists primitive values
+POOL_KERNELS = {"2,2,2": [2, 2, 2], "16,8,1": [16, 8, 1], "4,4,4": [4, 4, 4]}
+FREQ_DOWNSAMPLE = {"168,24,1": [168, 24, 1], "24,12,1": [24, 12, 1]}
+MLP_UNITS = {
+    "4x64x4": [[64, 64, 64, 64]]*4,
+    "4x64x2": [[64, 64, 64, 64]]*2,
+    "3x128x2": [[128, 128, 128]]*2,
+    "2x256x2": [[256, 256]]*2,
+    "2x512x2": [[512, 512]]*2,
+}
+PRUNERS = ("median", "hyperband")
+
+
+def search_space(trial: optuna.Trial, h: int, max_steps: int = 1000) -> dict:
+    """FinalModel params of one trial"""
+    return {
+        "input_size": trial.suggest_int("input_size", h*3, h*24, log=True),
+        "max_steps": trial.suggest_int("max_steps", max_steps, max_steps*2, log=True),
+        "learning_rate": trial.suggest_float("learning_rate", 1e-4, 1e-2, log=True),
+        "n_pool_kernel_size": POOL_KERNELS[
+            trial.suggest_categorical("n_pool_kernel_size", list(POOL_KERNELS))],
+        "n_freq_downsample": FREQ_DOWNSAMPLE[
+            trial.suggest_categorical("n_freq_downsample", list(FREQ_DOWNSAMPLE))],
+        "mlp_units": MLP_UNITS[trial.suggest_categorical("mlp_units", list(MLP_UNITS))],
+        "batch_size": 128,
+    }
+
+
+def params_of(trial: optuna.trial.FrozenTrial, h: int, max_steps: int = 1000) -> dict:
+    """FinalModel params of a finished trial"""
+    return search_space(optuna.trial.FixedTrial(trial.params), h, max_steps) # type: ignore
+
+
+class PruningCallback(Callback):
+    """reports the validation loss to optuna and stops pruned trials"""
+    def __init__(self, trial: optuna.Trial) -> None:
+        self.trial = trial
+
+    def on_validation_end(self, trainer, pl_module) -> None:
+        loss = trainer.callback_metrics.get("valid_loss")
+        if loss is None or trainer.sanity_checking:
+            return
+        self.trial.report(float(loss), trainer.global_step)
+        if self.trial.should_prune():
+            raise optuna.TrialPruned(f"pruned at step {trainer.global_step}")
+
+
+def _pruner(name: str) -> optuna.pruners.BasePruner:
+    if name == "median":
+        return optuna.pruners.MedianPruner(n_startup_trials=5, n_warmup_steps=200)
+    if name == "hyperband":
+        return optuna.pruners.HyperbandPruner(min_resource=100)
+    raise ValueError(f"pruner must be one of {PRUNERS}, got '{name}'")
+
+
+def load_study(storage: str, name: str, pruner: str = "median") -> optuna.Study:
+    """creates the study or loads it to resume, storage e.g. sqlite:///tuning.db"""
+    return optuna.create_study(study_name=name, storage=storage, direction="minimize",
+                               pruner=_pruner(pruner), load_if_exists=True)
+
+
+def run_worker(df: pl.DataFrame, h: int, storage: str, name: str, n_trials: int,
+               pruner: str = "median", threads: int = 1, val_check_steps: int = 50,
+               max_steps: int = 1000) -> None:
+    """runs trials on cpu until the study has n_trials finished or pruned trials
+
+    Args:
+        df (pl.DataFrame): training data in nixtla format, the last h days validate
+        h (int): forecast horizon (days)
+        storage (str): optuna storage url
+        name (str): study name
+        n_trials (int): total trials of the study, shared by all workers
+        pruner (str): one of PRUNERS
+        threads (int): torch threads of this worker
+        val_check_steps (int): training steps between validation losses
+        max_steps (int): lower end of the max_steps search range
+    """
+    study = load_study(storage, name, pruner)
+
+    def objective(trial: optuna.Trial) -> float:
+        params = search_space(trial, h, max_steps)
+        model = FinalModel(h, device="cpu", threads=threads, early_stopping=True, val_size=h,
+                           val_check_steps=val_check_steps, params=params,
+                           callbacks=[PruningCallback(trial)])
+        model.fit(df)
+        trajectory = model.model.models[0].valid_trajectories
+        if not trajectory: # e.g. val_check_steps > max_steps, nothing to score
+            raise optuna.TrialPruned("no validation loss was recorded")
+        trial.set_user_attr("converged_steps", model.converged_steps)
+        return float(min(loss for _, loss in trajectory))
+
+    done = (optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)
+    if len(study.get_trials(deepcopy=False, states=done)) < n_trials:
+        study.optimize(objective, callbacks=[optuna.study.MaxTrialsCallback(n_trials, done)])
+
+
+def write_best(study: optuna.Study, h: int, path: str, max_steps: int = 1000) -> dict:
+    """writes the params of the best trial as json for FinalModel(params=...)
+
+    The final model trains for the steps at which the validation loss of the trial was
+    lowest instead of the searched max_steps.
+    """
+    params = params_of(study.best_trial, h, max_steps)
+    converged = study.best_trial.user_attrs.get("converged_steps")
+    if converged:
+        params["max_steps"] = converged
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=2)
+    return params
@@ -1,4 +1,190 @@
-"""The moodule for plottig the results of the predictions"""
+"""The moodule for plottig the results of the predictions
 
-def plot_prediction()-> None:
-    pass
\ No newline at end of file
+History, test truth and the forecasts of every model are drawn per series. Long
+histories are downsampled before rendering, either with min/max binning (one polars
+pass over all series) or LTTB (largest triangle three buckets, per series), both keep
+the peaks and the shape of the curve. The figures are rendered in worker processes,
+as html (plotly, the library is loaded from the cdn so a file stays small) or png
+(matplotlib).
+"""
+
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import polars as pl
+
+FORMATS = ("html", "png")
+DOWNSAMPLING = ("minmax", "lttb")
+# the look of visualisations.ipynb
+COLOURS = {"history": "#9CB349", "truth": "#f0c03f", "SeasonalNaive": "#9f85bb",
+           "NHITS": "#ed6313"}
+_FALLBACK_COLOURS = ["#7ba4d1", "#eab287", "#AD704D", "#8a3d25", "#8b541d"]
+BACKGROUND = "#303438"
+
+
+def minmax_bins(df: pl.DataFrame, n_bins: int, id_col: str = "unique_id", target: str = "y"
+                ) -> pl.DataFrame:
+    """keeps the min and max row of every one of n_bins equal sized bins of a series,
+    plus its first and last row, i.e. at most 2*n_bins + 2 rows per series
+
+    Series with at most 2*n_bins rows are kept completely.
+    """
+    row = pl.int_range(pl.len()).over(id_col)
+    length = pl.len().over(id_col)
+    in_bin = pl.int_range(pl.len()).over(id_col, "_bin")
+    return (
+        df.sort(id_col, "ds")
+        .with_columns((row * n_bins // length).alias("_bin"))
+        .filter((length <= 2 * n_bins) | (row == 0) | (row == length - 1)
+                | (in_bin == pl.col(target).arg_min().over(id_col, "_bin"))
+                | (in_bin == pl.col(target).arg_max().over(id_col, "_bin")))
+        .drop("_bin")
+    )
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """indices of the n_out points largest triangle three buckets keeps of one series
+
+    The first and last point are always kept, of every bucket in between the point
+    spanning the largest triangle with the point kept before and the mean of the next
+    bucket.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep, a = [0], 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if end <= start:
+            continue
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        mean_x, mean_y = x[end:next_end].mean(), y[end:next_end].mean()
+        area = np.abs((x[a] - mean_x) * (y[start:end] - y[a])
+                      - (x[a] - x[start:end]) * (mean_y - y[a]))
+        a = start + int(area.argmax())
+        keep.append(a)
+    keep.append(n - 1)
+    return np.array(keep)
+
+
+def downsample(history: pl.DataFrame, max_points: int, method: str = "minmax",
+               id_col: str = "unique_id", target: str = "y") -> pl.DataFrame:
+    """at most about max_points rows per series, see ``minmax_bins`` and ``lttb``"""
+    if method not in DOWNSAMPLING:
+        raise ValueError(f"method must be one of {DOWNSAMPLING}, got '{method}'")
+    if method == "minmax": # min and max of every bin, plus the first and last row
+        return minmax_bins(history, max(max_points // 2, 1), id_col, target)
+    parts = []
+    for _, series in history.sort(id_col, "ds").group_by(id_col, maintain_order=True):
+        keep = lttb(series["ds"].cast(pl.Int32).to_numpy().astype(float),
+                    series[target].cast(pl.Float64).fill_null(0).to_numpy(), max_points)
+        parts.append(series[keep])
+    return pl.concat(parts) if parts else history
+
+
+def _traces(history: pl.DataFrame, test: pl.DataFrame | None,
+            predictions: pl.DataFrame | None, target: str) -> list[tuple[str, list, list]]:
+    """(name, dates, values) of every line of one series"""
+    traces = [("history", history["ds"].to_list(), history[target].to_list())]
+    if test is not None and not test.is_empty():
+        traces.append(("truth", test["ds"].to_list(), test[target].to_list()))
+    if predictions is not None and not predictions.is_empty():
+        for model in predictions.columns:
+            if model not in ("unique_id", "ds", target):
+                traces.append((model, predictions["ds"].to_list(), predictions[model].to_list()))
+    return traces
+
+
+def _colour(name: str, i: int) -> str:
+    return COLOURS.get(name, _FALLBACK_COLOURS[i % len(_FALLBACK_COLOURS)])
+
+
+def _render(uid: str, traces: list[tuple[str, list, list]], path: str, fmt: str) -> str:
+    """draws one series into path, runs in a worker process"""
+    if fmt == "html":
+        import plotly.graph_objects as go # pylint: disable=import-outside-toplevel
+        fig = go.Figure()
+        for i, (name, x, y) in enumerate(traces):
+            fig.add_trace(go.Scattergl(x=x, y=y, mode="lines", name=name,
+                                       line={"color": _colour(name, i), "width": 2,
+                                             "dash": "solid" if name in ("history", "truth")
+                                             else "dashdot"}))
+        fig.update_layout(title={"text": uid, "x": 0.5}, xaxis_title="Date",
+                          yaxis_title="Views", template="plotly_dark",
+                          plot_bgcolor=BACKGROUND, paper_bgcolor=BACKGROUND)
+        fig.write_html(path, include_plotlyjs="cdn")
+    else:
+        import matplotlib # pylint: disable=import-outside-toplevel
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt # pylint: disable=import-outside-toplevel
+        fig, ax = plt.subplots(figsize=(12, 5), facecolor=BACKGROUND)
+        ax.set_facecolor(BACKGROUND)
+        for i, (name, x, y) in enumerate(traces):
+            ax.plot(x, y, label=name, color=_colour(name, i), linewidth=1.5,
+                    linestyle="-" if name in ("history", "truth") else "-.")
+        ax.set_title(uid, color="white")
+        ax.tick_params(colors="white")
+        ax.grid(color="dimgrey")
+        ax.legend()
+        fig.savefig(path, dpi=100, bbox_inches="tight")
+        plt.close(fig)
+    return path
+
+
+def _file_name(uid: str) -> str:
+    return re.sub(r"[^\w\-]+", "_", uid).strip("_") or "series"
+
+
+def plot_prediction(history: pl.DataFrame, test: pl.DataFrame | None = None,
+                    predictions: pl.DataFrame | None = None, out_dir: str = "plots",
+                    ids: list[str] | None = None, fmt: str = "html", max_points: int = 500,
+                    method: str = "minmax", processes: int | None = None,
+                    target: str = "y") -> list[str]:
+    """draws history, test truth and forecasts of every series into one file each
+
+    Args:
+        history (pl.DataFrame): unique_id, ds, y e.g. the training data, downsampled
+        test (pl.DataFrame | None): unique_id, ds, y the true values of the horizon
+        predictions (pl.DataFrame | None): unique_id, ds and a column per model
+        out_dir (str): directory of the figures, created if missing
+        ids (list[str] | None): series to draw, all series of history if None
+        fmt (str): one of FORMATS
+        max_points (int): about the most history points drawn per series
+        method (str): one of DOWNSAMPLING
+        processes (int | None): render processes, all cpus if None
+        target (str): the true value column
+
+    Returns:
+        list[str]: paths of the written figures
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"fmt must be one of {FORMATS}, got '{fmt}'")
+    frames = {"history": history, "test": test, "predictions": predictions}
+    frames = {
+        name: None if df is None else df.with_columns(pl.col("unique_id").cast(pl.String))
+        .filter(pl.lit(True) if ids is None else pl.col("unique_id").is_in(ids))
+        for name, df in frames.items()
+    }
+    small = downsample(frames["history"], max_points, method, target=target) # type: ignore
+    parts = {
+        name: {} if df is None else df.sort("unique_id", "ds").partition_by(
+            "unique_id", as_dict=True, include_key=False)
+        for name, df in [("history", small), ("test", frames["test"]),
+                         ("predictions", frames["predictions"])]
+    }
+    os.makedirs(out_dir, exist_ok=True)
+
+    jobs = []
+    for (uid,), series in parts["history"].items():
+        traces = _traces(series, parts["test"].get((uid,)),
+                         parts["predictions"].get((uid,)), target)
+        jobs.append((uid, traces, os.path.join(out_dir, f"{_file_name(uid)}.{fmt}"), fmt))
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(processes, mp_context=context) as pool:
+        # a few series per task, so thousands of small figures do not wait on the queue
+        chunksize = max(1, len(jobs) // (4 * (processes or os.cpu_count() or 1)))
+        return list(pool.map(_render, *zip(*jobs), chunksize=chunksize)) if jobs else []
@@ -0,0 +1,55 @@
+"""Plots history, test truth and the newest test forecasts of every series
+
+Usage (from any directory): python plot_predictions.py [series ...]
+The forecasts come from the forecast store written by make_prediction.py,
+without series names all series are drawn, see [plots] in config.toml
+"""
+import tomllib
+import sys
+import os
+import polars as pl
+from modules import dataprocessing as data
+from modules import store, forecasts
+from modules import visialising as vis
+scripts_dir_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, scripts_dir_path)
+base_dir = scripts_dir_path + "/../"
+
+
+def main() -> None:
+    """draws the figures configured in config.toml"""
+    with open(os.path.join(scripts_dir_path, "config.toml"), "rb") as f:
+        config = tomllib.load(f)
+    ids = sys.argv[1:] or None
+
+    test_pred = forecasts.latest(base_dir+config["forecasts"]["path"], ids=ids, kind="test")
+    if test_pred.is_empty(): # type: ignore
+        sys.exit("No test forecasts in the forecast store, run make_prediction.py first")
+    predictions = test_pred.pivot( # type: ignore
+        on="model", index=["unique_id", "ds"], values="y_hat")
+
+    if config["store"]["use"]:
+        df = store.load(base_dir+config["store"]["path"],
+                        end_date=config["predictions"]["predict_from"])
+    else:
+        df = data.ingest(base_dir+config["data"]["path"])
+        df = data.preprocess(df, end_date=config["predictions"]["predict_from"],
+                             outlier_method=config["preprocessing"]["outlier_method"],
+                             exclude=config["preprocessing"]["outlier_exclude"],
+                             fill=config["preprocessing"]["fill"] or None,
+                             **config["preprocessing"]["outlier_params"])
+    test_start = predictions["ds"].min()
+    history = df.filter(pl.col("ds") < test_start) # type: ignore
+    test = df.filter(pl.col("ds") >= test_start) # type: ignore
+
+    settings = config["plots"]
+    paths = vis.plot_prediction(history, test, predictions, out_dir=base_dir+settings["path"],
+                                ids=ids, fmt=settings["format"],
+                                max_points=settings["max_points"],
+                                method=settings["downsampling"],
+                                processes=settings["processes"] or None)
+    print(f"Wrote {len(paths)} figures to {base_dir+settings['path']}")
+
+
+if __name__ == "__main__": # the worker processes import this file again
+    main()
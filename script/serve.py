@@ -0,0 +1,100 @@
+"""Local forecast server, loads the models once and answers forecast requests
+
+Usage (from any directory): python serve.py
+Then e.g. GET http://127.0.0.1:8765/forecast?model=final&ids=Latte,Mocha&h=7
+model is "final" (the newest stored FinalModel) or "baseline", ids defaults to all series
+and h to the full horizon. The answer is a json list of {unique_id, ds, y_hat}.
+"""
+import json
+import tomllib
+import sys
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import polars as pl
+from modules import dataprocessing as data
+from modules import store, artifacts, serving, inference
+from modules.baseline import BaseLineModel
+scripts_dir_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, scripts_dir_path)
+base_dir = scripts_dir_path + "/../"
+
+with open(os.path.join(scripts_dir_path, "config.toml"), "rb") as f:
+    config = tomllib.load(f)
+
+if config["store"]["use"]:
+    history = store.load(base_dir+config["store"]["path"])
+else:
+    history = data.preprocess(data.ingest(base_dir+config["data"]["path"]),
+                              outlier_method=config["preprocessing"]["outlier_method"],
+                              exclude=config["preprocessing"]["outlier_exclude"],
+                              fill=config["preprocessing"]["fill"] or None,
+                              **config["preprocessing"]["outlier_params"])
+origin = str(history["ds"].max())
+
+batchers = {}
+final_key = artifacts.latest(base_dir+config["artifacts"]["path"])
+compiled_dir = base_dir+config["serving"]["compiled"] if config["serving"]["compiled"] else ""
+compiled_key = None
+if compiled_dir and os.path.exists(os.path.join(compiled_dir, inference.META_FILE)):
+    with open(os.path.join(compiled_dir, inference.META_FILE), encoding="utf-8") as f:
+        compiled_key = json.load(f).get("artifact") or "compiled"
+    if final_key is not None and compiled_key != final_key:
+        print(f"The export of {compiled_key} is older than the stored model {final_key}, "
+              "serving the stored model, run export_model.py to update the export")
+        compiled_key = None
+if compiled_key is not None:
+    # the exported final model, written by export_model.py, predicts without lightning
+    batchers["final"] = serving.Batcher(serving.compiled_forecaster(
+        inference.CompiledPredictor(compiled_dir), history, compiled_key),
+        config["serving"]["max_wait"])
+elif final_key is not None:
+    final = artifacts.load(base_dir+config["artifacts"]["path"], final_key)
+    batchers["final"] = serving.Batcher(serving.final_forecaster(final, history, final_key),
+                                        config["serving"]["max_wait"])
+baseline = BaseLineModel(config["baseline"]["season_length"])
+baseline.fit(history)
+batchers["baseline"] = serving.Batcher(
+    serving.baseline_forecaster(baseline, history, config["serving"]["horizon"],
+                                f"baseline-{origin}"),
+    config["serving"]["max_wait"])
+
+
+class ForecastHandler(BaseHTTPRequestHandler):
+    """GET /forecast?model=...&ids=...&h=..."""
+    def do_GET(self) -> None: # pylint: disable=invalid-name
+        """answers a forecast request"""
+        url = urlparse(self.path)
+        if url.path != "/forecast":
+            self._send(404, {"error": "not found"})
+            return
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        batcher = batchers.get(query.get("model", "final"))
+        if batcher is None:
+            self._send(404, {"error": f"model must be one of {sorted(batchers)}"})
+            return
+        ids = query["ids"].split(",") if "ids" in query else sorted(batcher.forecaster.series)
+        try:
+            pred = batcher.submit(ids, int(query.get("h", batcher.forecaster.h))).result()
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+            return
+        except KeyError as e:
+            self._send(404, {"error": e.args[0]})
+            return
+        self._send(200, pred.with_columns(pl.col("ds").cast(pl.String)).to_dicts())
+
+    def _send(self, status: int, body) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+server = ThreadingHTTPServer((config["serving"]["host"], config["serving"]["port"]),
+                             ForecastHandler)
+print(f"Serving {sorted(batchers)} forecasts from {origin} on "
+      f"http://{config['serving']['host']}:{config['serving']['port']}/forecast")
+server.serve_forever()
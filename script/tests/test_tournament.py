@@ -0,0 +1,56 @@
+"""End to end check of the tournament leaderboard on a small synthetic panel
+
+Run from the script directory: python -m pytest tests
+"""
+import os
+import sys
+import polars as pl
+import pytest
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from benchmarks.synthetic import long_panel
+from modules import dataprocessing as data
+from modules.tournament import Candidate, leaderboard, run_tournament
+
+H = 14
+
+
+def test_leaderboard_ranks_candidates():
+    """every candidate gets a row with its metrics, the better forecast ranks first"""
+    df = long_panel(5, years=1)
+    _, test = data.train_test_split(df, str(df["ds"].max()), H) # the last H days
+    candidates = [Candidate("exact", "stats", "statsforecast.models.Naive"),
+                  Candidate("off", "stats", "statsforecast.models.Naive", features=["trend"])]
+    predictions = pl.concat([
+        test.select("unique_id", "ds", pl.col("y").alias("y_hat"),
+                    pl.lit("exact").alias("candidate"), pl.lit(1.0).alias("seconds")),
+        test.select("unique_id", "ds", (pl.col("y") + 10).alias("y_hat"),
+                    pl.lit("off").alias("candidate"), pl.lit(2.0).alias("seconds")),
+    ])
+
+    board = leaderboard(predictions, test, candidates)
+
+    assert board["candidate"].to_list() == ["exact", "off"]
+    assert board["mae"].to_list() == [0.0, 10.0]
+    assert {"mape", "rmse", "smape", "direction", "family", "features", "seconds"} \
+        <= set(board.columns)
+    assert board.filter(pl.col("candidate") == "off")["features"].item() == "trend"
+
+
+def test_key_depends_on_feature_params():
+    """candidates with other feature params do not share cached predictions"""
+    candidate = Candidate("fourier", "stats", "statsforecast.models.Naive", features=["fourier"])
+    data_summary = {"train": "0", "rows": 1}
+    assert candidate.key(data_summary, H, {"fourier": {"k": 3}}) \
+        != candidate.key(data_summary, H, {"fourier": {"k": 5}})
+
+
+def test_all_candidates_failing_is_reported(tmp_path):
+    """without a single finished candidate the failures are raised, not an empty concat"""
+    df = long_panel(3, years=1)
+    train, test = data.train_test_split(df, str(df["ds"].max()), H)
+    candidates = [Candidate("broken", "stats", "no_such_package.Model")]
+
+    with pytest.raises(RuntimeError, match="broken"):
+        run_tournament(candidates, train, test, H, str(tmp_path), {"stats": {"workers": 1}})
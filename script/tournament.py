@@ -0,0 +1,52 @@
+"""Model tournament: every candidate of tournament.toml on the test split of config.toml
+
+Usage (from any directory): python tournament.py
+Writes a leaderboard parquet with a row per candidate, see [tournament] in config.toml
+"""
+import tomllib
+import sys
+import os
+from datetime import date
+from modules import dataprocessing as data
+from modules import store
+from modules import tournament
+scripts_dir_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, scripts_dir_path)
+base_dir = scripts_dir_path + "/../"
+
+
+def main() -> None:
+    """runs the tournament configured in config.toml"""
+    with open(os.path.join(scripts_dir_path, "config.toml"), "rb") as f:
+        config = tomllib.load(f)
+
+    delta = date.fromisoformat(config["predictions"]["predict_until"]
+                               ) - date.fromisoformat(config["predictions"]["predict_from"])
+    horizon = int(delta.days)
+
+    if config["store"]["use"]:
+        df = store.load(base_dir+config["store"]["path"],
+                        end_date=config["predictions"]["predict_from"],
+                        compact_dtypes=config["data"]["compact"])
+    else:
+        df = data.ingest(base_dir+config["data"]["path"], compact_dtypes=config["data"]["compact"])
+        df = data.preprocess(df, end_date=config["predictions"]["predict_from"],
+                             outlier_method=config["preprocessing"]["outlier_method"],
+                             exclude=config["preprocessing"]["outlier_exclude"],
+                             fill=config["preprocessing"]["fill"] or None,
+                             **config["preprocessing"]["outlier_params"])
+    train, test = data.train_test_split(df, config["predictions"]["predict_from"], horizon)
+
+    settings = config["tournament"]
+    candidates = tournament.load_candidates(os.path.join(scripts_dir_path, settings["candidates"]))
+    board = tournament.run_tournament(
+        candidates, train, test, horizon,
+        cache_dir=base_dir+settings["cache"], resources=settings["resources"],
+        feature_params=config["features"]["params"],
+    )
+    board.write_parquet(base_dir+config["predictions"]["path"]+"script_leaderboard.parquet")
+    print(board)
+
+
+if __name__ == "__main__": # the worker processes import this file again
+    main()
@@ -0,0 +1,63 @@
+"""Hyperparameter search for the FinalModel, resumable and with parallel trials
+
+Usage (from any directory): python tune.py
+The study is stored in the SQLite database from [tuning] in config.toml, running the
+script again continues it. The best params are written to the json make_prediction loads.
+"""
+import tomllib
+import sys
+import os
+import multiprocessing
+from datetime import date
+from modules import dataprocessing as data
+from modules import store, tuning
+scripts_dir_path = os.path.abspath(os.path.dirname(__file__))
+sys.path.insert(0, scripts_dir_path)
+base_dir = scripts_dir_path + "/../"
+
+
+def main() -> None:
+    """runs the configured search with one process per worker"""
+    with open(os.path.join(scripts_dir_path, "config.toml"), "rb") as f:
+        config = tomllib.load(f)
+
+    delta = date.fromisoformat(config["predictions"]["predict_until"]
+                               ) - date.fromisoformat(config["predictions"]["predict_from"])
+    horizon = int(delta.days)
+
+    if config["store"]["use"]:
+        df = store.load(base_dir+config["store"]["path"],
+                        end_date=config["predictions"]["predict_from"],
+                        compact_dtypes=config["data"]["compact"])
+    else:
+        df = data.ingest(base_dir+config["data"]["path"], compact_dtypes=config["data"]["compact"])
+        df = data.preprocess(df, end_date=config["predictions"]["predict_from"],
+                             outlier_method=config["preprocessing"]["outlier_method"],
+                             exclude=config["preprocessing"]["outlier_exclude"],
+                             fill=config["preprocessing"]["fill"] or None,
+                             **config["preprocessing"]["outlier_params"])
+    # tune on the training part only, its last horizon days are the validation window
+    train, _ = data.train_test_split(df, config["predictions"]["predict_from"], horizon)
+
+    settings = config["tuning"]
+    storage = "sqlite:///" + base_dir + settings["database"]
+    tuning.load_study(storage, settings["study"], settings["pruner"]) # create it once
+    args = (train, horizon, storage, settings["study"], settings["n_trials"],
+            settings["pruner"], settings["threads_per_worker"], settings["val_check_steps"],
+            settings["max_steps"])
+
+    workers = [multiprocessing.get_context("spawn").Process(target=tuning.run_worker, args=args)
+               for _ in range(settings["workers"])]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    study = tuning.load_study(storage, settings["study"], settings["pruner"])
+    params = tuning.write_best(study, horizon, base_dir+settings["best_params"],
+                               settings["max_steps"])
+    print(f"Best validation loss {study.best_value:.4f} with {params}")
+
+
+if __name__ == "__main__": # the worker processes import this file again
+    main()